@@ -0,0 +1,208 @@
+import os
+import json
+import asyncio
+import logging
+import tiktoken
+from dotenv import load_dotenv
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage, RemoveMessage
+from langchain_openai import ChatOpenAI
+from app.backend.storage.models import UserMetadata, EXTRACTED_FIELDS
+from app.backend.tracing import tracer
+
+# Load environment variables
+load_dotenv()
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000))
+# Per-agent overrides, e.g. "general_chat_agent=800,lifestyle_coach_agent=3000"
+CONTEXT_TOKEN_BUDGETS = os.getenv("CONTEXT_TOKEN_BUDGETS", "")
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", 300))
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", "gpt-4o-mini")
+# Id of the metadata and summary message at the head of every thread, replaced in place on each request
+CONTEXT_MESSAGE_ID = "conversation-context"
+
+summary_prompt = '''
+        You maintain a running summary of a conversation between a user and a
+        stress and decision-making assistant. Fold the new turns into the existing
+        summary. Keep what the user is dealing with, decisions made or pending and
+        advice already given. Write at most {max_tokens} tokens of plain prose.
+    '''
+
+
+class ContextBuilder:
+    '''Keeps each conversation thread's prompt within a token budget.
+
+    The checkpointed thread starts with one context message (the user's compact metadata and a
+    rolling summary of older turns), followed by the recent turns themselves. Each request refreshes
+    the context message and appends the new message. Once the turns outgrow the agent's budget, the
+    oldest ones are folded into the summary in the background and removed from the thread by id on
+    the next request, so history lives in the checkpoint and nothing is dropped before it is summarized.
+    '''
+
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET, agent_budgets: str = CONTEXT_TOKEN_BUDGETS,
+                 summary_tokens: int = CONTEXT_SUMMARY_TOKENS, summary_model: str = CONTEXT_SUMMARY_MODEL):
+        self.budget = budget
+        self.agent_budgets = {agent.strip(): int(tokens) for agent, tokens in
+                              (item.split("=") for item in agent_budgets.split(",") if "=" in item)}
+        self.summary_tokens = summary_tokens
+        self.summary_model = summary_model
+        self._encoding = None
+        self._llm = None
+        self.summarizing = {}  # thread id -> task
+        self.summarized = {}  # thread id -> (new summary, ids of the messages it covers), applied on the next request
+        self.requests = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.summaries = 0
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = ChatOpenAI(model_name=self.summary_model, temperature=0, max_tokens=self.summary_tokens)
+        return self._llm
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            try:
+                self._encoding = tiktoken.encoding_for_model("gpt-4o")
+            except Exception as e:
+                # tiktoken downloads its vocabulary on first use; estimate offline instead
+                logging.warning(f"Could not load the tokenizer, estimating token counts: {e}")
+                self._encoding = False
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        if not self.encoding:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text))
+
+    def budget_for(self, agent: str = None) -> int:
+        return self.agent_budgets.get(agent, self.budget)
+
+    @staticmethod
+    def render_metadata(metadata: UserMetadata) -> str:
+        # Only the extracted fields shape an answer; ids and timestamps are left out
+        lines = [f"{field}: {'; '.join(getattr(metadata, field))}"
+                 for field in EXTRACTED_FIELDS if getattr(metadata, field)]
+        return "\n".join(lines) or "none yet"
+
+    @staticmethod
+    def render_message(message: BaseMessage) -> str:
+        '''What a message costs in the prompt: its text plus any tool call arguments'''
+        text = message.content if isinstance(message.content, str) else json.dumps(message.content)
+        for call in getattr(message, "tool_calls", None) or []:
+            text += f"\n{call['name']}({json.dumps(call['args'])})"
+        return text
+
+    @staticmethod
+    def render_turn(turn: list) -> str:
+        '''The user's message and the answers in one turn, without routing and tool chatter'''
+        lines = []
+        for message in turn:
+            if isinstance(message, HumanMessage):
+                lines.append(f"User: {message.content}")
+            elif isinstance(message, AIMessage) and message.content and not message.tool_calls:
+                lines.append(f"Assistant: {message.content}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def split_turns(messages: list) -> list:
+        '''Groups a thread's messages into turns, each starting at a user message'''
+        turns = []
+        for message in messages:
+            if message.id == CONTEXT_MESSAGE_ID:
+                continue
+            if isinstance(message, HumanMessage) or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        return turns
+
+    def build(self, thread_id: str, messages: list, metadata: UserMetadata, user_input: str, agent: str = None) -> list:
+        '''Messages that add a new turn to a thread holding the given messages: the refreshed context
+        message, removals of turns already folded into the summary, and the user's message'''
+        with tracer.span("context", agent or "supervisor") as attributes:
+            budget = self.budget_for(agent)
+            context_message = next((message for message in messages if message.id == CONTEXT_MESSAGE_ID), None)
+            summary = context_message.response_metadata.get("summary", "") if context_message else ""
+            turns = self.split_turns(messages)
+
+            # Apply a summary finished since the last request: it replaces the turns it covers
+            removed = []
+            summarized = self.summarized.pop(thread_id, None)
+            if summarized:
+                summary, folded_ids = summarized
+                removed = [message for turn in turns if turn[0].id in folded_ids for message in turn]
+                turns = [turn for turn in turns if turn[0].id not in folded_ids]
+
+            header = f"User Metadata:\n{self.render_metadata(metadata)}"
+            summary_text = f"Earlier Conversation (summary):\n{summary}" if summary else ""
+            fixed = sum(self.count(part) for part in (header, summary_text, user_input) if part)
+            turn_tokens = [sum(self.count(self.render_message(message)) for message in turn) for turn in turns]
+
+            # Newest turns first, until the budget runs out
+            used, kept = fixed, 0
+            for tokens in reversed(turn_tokens):
+                if used + tokens > budget:
+                    break
+                used += tokens
+                kept += 1
+
+            # Older turns stay in the thread until their summary is ready
+            overflow = turns[:len(turns) - kept]
+            if overflow:
+                self.schedule_summary(thread_id, summary, overflow)
+
+            # The model still sees the overflow turns, so they count towards what this request sends
+            sent = fixed + sum(turn_tokens)
+            self.requests += 1
+            self.total_tokens += sent
+            self.max_tokens = max(self.max_tokens, sent)
+            attributes.update(tokens=sent, budget=budget, recent_turns=kept, pending_turns=len(overflow),
+                              folded_messages=len(removed))
+            logging.info(f"Context for thread {thread_id}: {sent}/{budget} tokens "
+                         f"({kept} recent turns, {len(overflow)} turns pending summary, "
+                         f"{len(removed)} messages folded into the summary)")
+            context = "\n\n".join(part for part in (header, summary_text) if part)
+            return [SystemMessage(context, id=CONTEXT_MESSAGE_ID, response_metadata={"summary": summary}),
+                    *(RemoveMessage(id=message.id) for message in removed),
+                    HumanMessage(user_input)]
+
+    def schedule_summary(self, thread_id: str, summary: str, turns: list):
+        task = self.summarizing.get(thread_id)
+        if task is not None and not task.done():
+            return  # the running summary picks up the rest on a later request
+        if thread_id in self.summarized:
+            return  # already summarized, waiting to be applied
+        self.summarizing[thread_id] = asyncio.create_task(self.summarize(thread_id, summary, turns))
+
+    async def summarize(self, thread_id: str, summary: str, turns: list):
+        '''Folds the given turns into the thread's summary, to be applied on its next request'''
+        conversation = "\n".join(text for text in map(self.render_turn, turns) if text)
+        try:
+            result = await self.llm.ainvoke([
+                SystemMessage(summary_prompt.format(max_tokens=self.summary_tokens)),
+                HumanMessage(f"Existing summary:\n{summary or 'none'}\n\nNew turns:\n{conversation}"),
+            ])
+            self.summarized[thread_id] = (result.content, {turn[0].id for turn in turns})
+            self.summaries += 1
+        except Exception as e:
+            logging.warning(f"Could not summarize thread {thread_id}: {e}")
+        finally:
+            self.summarizing.pop(thread_id, None)
+
+    def forget(self, thread_id: str):
+        self.summarized.pop(thread_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "budget": self.budget,
+            "agent_budgets": dict(self.agent_budgets),
+            "requests": self.requests,
+            "avg_tokens": self.total_tokens / self.requests if self.requests else 0.0,
+            "max_tokens": self.max_tokens,
+            "summaries": self.summaries,
+            "summarizing": len(self.summarizing),
+            "pending_summaries": len(self.summarized),
+        }
+
+
+context_builder = ContextBuilder()
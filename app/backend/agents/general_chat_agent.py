@@ -17,7 +17,7 @@ prompt_template = ('''
         )
 
 
-llm = ChatOpenAI(model_name="gpt-4o", temperature=0,api_key=key)
+llm = ChatOpenAI(model_name="gpt-4o", temperature=0, api_key=key, stream_usage=True)
 
 general_chat_agent = create_react_agent(
     llm,
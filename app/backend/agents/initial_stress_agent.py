@@ -3,16 +3,14 @@ import re
 import logging
 import os
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_community.vectorstores import Chroma
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
+from app.backend.rag.retrieval import retrieval_service
 
 # Load environment variables
 load_dotenv()
@@ -20,34 +18,14 @@ key = os.getenv("OPENAI_API_KEY")
 
 ## INDEXING ##
 
-# Load Documents
-loader = WebBaseLoader(web_paths=["https://pmc.ncbi.nlm.nih.gov/articles/PMC10741869/",
-                                  "https://www.healthline.com/health/grounding-techniques#physical-techniques",
-                                  "https://www.resiliencelab.us/thought-lab/grounding-techniques",
-                                  "https://www.ncbi.nlm.nih.gov/books/NBK207188/box/part1_ch4.box5/?report=objectonly"],)
-docs = []
-for doc in loader.lazy_load():
-    docs.append(doc)
-
-
-# Split
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-splits = text_splitter.split_documents(docs)
-
-
-
-# Embed
-vectorstore = Chroma.from_documents(documents=splits, 
-                                    embedding=OpenAIEmbeddings())
-
-
-retriever = vectorstore.as_retriever()
+# Open the index built offline by `python -m app.backend.rag.ingest`
+retrieval_service.open("initial_stress_agent")
 
 # Define retrieve tool that returns the relevant docs + their info
 def retrieve(query: str):
     '''Function to retrieve relevant documents based on a query'''
-    # Use the retriever to get relevant documents
-    docs = retriever.invoke(query)
+    # Use the shared (memoized) retrieval service to get relevant documents
+    docs = retrieval_service.retrieve("initial_stress_agent", query)
     # Extract the text content from the documents
     texts = [doc.page_content for doc in docs]
     # Join the texts into a single string
@@ -67,7 +45,7 @@ prompt_template = ('''
         )
 
 
-llm = ChatOpenAI(model_name="gpt-4o", temperature=0,api_key=key)
+llm = ChatOpenAI(model_name="gpt-4o", temperature=0, api_key=key, stream_usage=True)
 
 init_stress_agent = create_react_agent(
     llm,
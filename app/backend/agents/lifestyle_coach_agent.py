@@ -2,16 +2,14 @@ import logging
 import uuid
 import os
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_community.vectorstores import Chroma
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
+from app.backend.rag.retrieval import retrieval_service
 
 # Load environment variables
 load_dotenv()
@@ -19,32 +17,13 @@ key = os.getenv("OPENAI_API_KEY")
 
 ## INDEXING ##
 
-# Load Documents
-loader = WebBaseLoader(web_paths=["https://www.psychologytoday.com/us/blog/the-mindful-path-to-self-acceptance/202103/how-to-break-free-from-the-prison-of-indecisiveness",
-                                  "https://growtherapy.com/blog/mindfulness-exercises-to-reduce-stress-and-anxiety/",
-                                  "https://www.healthline.com/nutrition/16-ways-relieve-stress-anxiety",],)
-docs = []
-for doc in loader.lazy_load():
-    docs.append(doc)
-
-
-# Split
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-splits = text_splitter.split_documents(docs)
-
-
-
-# Embed
-vectorstore = Chroma.from_documents(documents=splits, 
-                                    embedding=OpenAIEmbeddings())
-
-
-retriever = vectorstore.as_retriever()
+# Open the index built offline by `python -m app.backend.rag.ingest`
+retrieval_service.open("lifestyle_coach_agent")
 
 # Define retrieve tool that returns the relevant docs + their info
 def retrieve(query: str):
     '''Function to retrieve relevant documents based on a query'''
-    docs = retriever.invoke(query)
+    docs = retrieval_service.retrieve("lifestyle_coach_agent", query)
     texts = [doc.page_content for doc in docs]
     return "\n\n".join(texts),docs
 
@@ -64,7 +43,7 @@ prompt_template = ('''
 
 
 # Build agent
-llm = ChatOpenAI(model_name="gpt-4o", temperature=0,api_key=key)
+llm = ChatOpenAI(model_name="gpt-4o", temperature=0, api_key=key, stream_usage=True)
 
 lifestyle_coach_agent = create_react_agent(
     llm,
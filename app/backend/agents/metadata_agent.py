@@ -1,119 +1,222 @@
 import os
-import uuid
 import logging
 import json
 import ast
+from datetime import datetime
+from typing import List
 from dotenv import load_dotenv
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain.schema import HumanMessage, AIMessage
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.checkpoint.base import Checkpoint
-from pymongo import MongoClient
-from beanie import init_beanie
-from langgraph.prebuilt import create_react_agent
-from pydantic import BaseModel
-from app.backend.storage.models import UserMetadata
+from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.utils.json import parse_partial_json
+from langchain_openai import ChatOpenAI
+from pydantic import BaseModel, Field
+from app.backend.storage.models import UserMetadata, EXTRACTED_FIELDS
 from app.backend.storage.session_managing import MetadataManager
+from app.backend.tracing import tracer, message_usage
 
 
-# Serves as cross-thread memory setup 
+# Serves as cross-thread memory setup
 
 # Load environment variables
 load_dotenv()
 openai_key = os.getenv("OPENAI_API_KEY")
-mongo_key = os.getenv("MONGO_URI")
-
-# Initialize MongoDB connection
-async def init_database():
-    client = MongoClient(mongo_key)
-    await init_beanie(
-        database=client.lulullm,
-        document_models=[UserMetadata],
-    )
 
 prompt_template = '''
-        You are an extractor agent that takes a chat history and metadata
-        and updates the metadata by extracting info from the chat history such as:
+        You are an extractor agent that takes the user's current metadata and the
+        chat turns that happened since it was last updated, and updates the metadata
+        by extracting info from those new turns such as:
         - Stress triggers
         - Indecisiveness triggers
         - Preferred tools
         - Decision patterns
-        - Other relevant information
-        then returns it looking like this (the original metadata) in a Python dictionary format:
-        {
-            'user_id': 'yash_khanna',
-            'session_id': '123456',
-            'stress_triggers': ['perfectionism', 'time pressure'],
-            'indecisiveness_triggers': ['fear of failure', 'overthinking'],
-            'preferred_tools': ['weighted scoring', 'body scan'],
-            'decision_patterns': ['avoids financial decisions'],
-            'last_interaction': '2025-05-16T16:03:00Z'
-        }
+        Keep everything already in the metadata unless the new turns contradict it.
+        For each field the new turns change, return its full updated list; leave out
+        fields the new turns say nothing about.
+    '''
+
+batch_prompt_template = prompt_template + '''
+        You will be given several users, each under a "### <user_key>" heading.
+        Return exactly one update per user, tagged with that user's user_key.
     '''
 
-# Build agent
+# Output schemas bound to the UserMetadata fields
+class MetadataUpdate(BaseModel):
+    '''The user's updated metadata'''
+    stress_triggers: List[str] = Field(default_factory=list, description="Things that cause the user stress or anxiety")
+    indecisiveness_triggers: List[str] = Field(default_factory=list, description="Things that make the user indecisive")
+    preferred_tools: List[str] = Field(default_factory=list, description="Techniques or frameworks the user likes using")
+    decision_patterns: List[str] = Field(default_factory=list, description="Recurring patterns in how the user decides")
+
+
+class KeyedMetadataUpdate(MetadataUpdate):
+    '''One user's updated metadata within a batch'''
+    user_key: str = Field(description="The user_key heading this update belongs to, e.g. user_1")
+
+
+class MetadataBatchUpdate(BaseModel):
+    '''Updated metadata for every user in the batch'''
+    updates: List[KeyedMetadataUpdate]
+
+
+def compact_metadata(metadata: UserMetadata) -> dict:
+    return {field: getattr(metadata, field) for field in EXTRACTED_FIELDS}
+
+
+def format_turns(turns) -> str:
+    return "\n".join(f"User: {user_input}\nAssistant: {response}" for user_input, response in turns)
+
+# Build extractors
 llm = ChatOpenAI(model_name="gpt-4o", temperature=0,api_key=os.getenv(openai_key))
 
-metadata_agent = create_react_agent(
-    llm,
-    tools=[],
-    prompt=prompt_template,
-    checkpointer=MemorySaver(),
-)
+metadata_agent = llm.with_structured_output(MetadataUpdate, method="function_calling", include_raw=True)
+batch_metadata_agent = llm.with_structured_output(MetadataBatchUpdate, method="function_calling", include_raw=True)
+
+# Extraction call counters
+extraction_stats = {"calls": 0, "batch_calls": 0, "users": 0, "salvaged": 0, "failed": 0, "skipped": 0}
+
+
+def clean_fields(values: dict) -> dict:
+    '''Keeps only the extracted fields that are (or can be coerced to) lists of strings'''
+    cleaned = {}
+    for field in EXTRACTED_FIELDS:
+        value = values.get(field)
+        if isinstance(value, str):
+            value = [value]
+        if isinstance(value, list):
+            cleaned[field] = [str(item).strip() for item in value
+                              if isinstance(item, (str, int, float)) and str(item).strip()]
+    return cleaned
+
 
+def raw_arguments(raw):
+    '''Best-effort dict from a reply whose structured output failed validation'''
+    if raw is None:
+        return {}
+    for call in getattr(raw, "tool_calls", None) or []:
+        if isinstance(call.get("args"), dict):
+            return call["args"]
+    for call in getattr(raw, "invalid_tool_calls", None) or []:
+        if isinstance(call.get("args"), str):
+            parsed = parse_partial_json(call["args"])
+            if isinstance(parsed, dict):
+                return parsed
+    content = raw.content if isinstance(raw.content, str) else ""
+    content = content.strip().removeprefix("```json").removeprefix("```python").removesuffix("```").strip()
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            parsed = parse(content)
+            if isinstance(parsed, dict):
+                return parsed
+        except (ValueError, SyntaxError):
+            continue
+    return {}
 
-async def process_history(user_id:str, history: str, metadata_manager: MetadataManager):
 
+def parse_update(result: dict):
+    '''Fields the extractor actually returned, salvaging what it can on failure (None if nothing usable)'''
+    if result.get("parsed") is not None:
+        # Omitted fields are left out, so they keep their stored values instead of being reset to []
+        return clean_fields(result["parsed"].model_dump(exclude_unset=True))
+    update = clean_fields(raw_arguments(result.get("raw")))
+    if not update:
+        return None
+    extraction_stats["salvaged"] += 1
+    logging.warning(f"Salvaged {sorted(update)} from invalid extractor output: {result.get('parsing_error')}")
+    return update
+
+
+async def apply_update(user_id: str, metadata: UserMetadata, update: dict, metadata_manager: MetadataManager):
+    '''Merges only the fields present in the update into the user's metadata'''
+    if update is None:
+        extraction_stats["failed"] += 1
+        raise ValueError("Failed to parse extractor output into metadata.")
+    new_metadata = metadata.model_copy(update={**update, "last_interaction": datetime.now()})
+    await metadata_manager.add_metadata(user_id, new_metadata)
+    print(f"Metadata {new_metadata} updated")
+    return new_metadata
+
+
+async def process_history(user_id:str, turns: list, metadata_manager: MetadataManager):
+    '''Folds the (user_input, response) turns not yet distilled into the user's metadata'''
+    if not turns:
+        extraction_stats["skipped"] += 1
+        return None  # Nothing new since the last extraction, so skip the LLM call
+    async with metadata_manager.extracting([user_id]):
+        return await extract_history(user_id, turns, metadata_manager)
+
+
+async def extract_history(user_id: str, turns: list, metadata_manager: MetadataManager):
+    '''process_history for a caller already holding the user's extraction lock'''
     metadata = await metadata_manager.get_metadata(user_id)
-    # Create context-aware input
+    # Create context-aware input from the compact metadata and only the new turns
     context = f"""
     User Metadata:
-    {metadata.model_dump()}
+    {compact_metadata(metadata)}
 
-    Chat History:
-    {history}
+    New Chat Turns:
+    {format_turns(turns)}
     """
 
-    config = {"configurable":
-              {"thread_id": str(uuid.uuid4())}}
-
-    response = await metadata_agent.ainvoke({"messages": context}, config=config)
-    logging.info(f"Metadata {response} extracted")
-    print(f"Metadata {response} extracted")
-    
-    new_metadata = None
-    # Extract the AIMessage from the response
-    try:
-        messages = response.get("messages", [])
-        ai_message = next(
-            (message for message in messages if isinstance(message, AIMessage)), None
-        )
-        print(f"AIMessage content type: {type(ai_message.content)}")
-        print(f"AIMessage content: {ai_message.content}")
-        cleaned_content = ai_message.content.strip("```python").strip("```").strip()
-        llm_response = ast.literal_eval(cleaned_content)
-        print(f"LLM response: {llm_response}")
-        new_metadata = UserMetadata(
-            user_id=llm_response["user_id"],
-            session_id=llm_response["session_id"],
-            stress_triggers=llm_response["stress_triggers"],
-            indecisiveness_triggers=llm_response["indecisiveness_triggers"],
-            preferred_tools=llm_response["preferred_tools"],
-            decision_patterns=llm_response["decision_patterns"],
-            last_interaction=llm_response["last_interaction"]
-        )
-        print(f"New metadata created: {new_metadata}")
-    except (ValueError, SyntaxError) as e:
-        logging.error(f"Error parsing AIMessage content: {e}")
-        print(f"Error parsing AIMessage content: {e}")
-        raise ValueError("Failed to parse AIMessage content into metadata.")
-    try:
-        print("Calling add_metadata")  
-        await metadata_manager.add_metadata(user_id, new_metadata)
-        print(f"Metadata {new_metadata} updated")
-    except Exception as e:
-        logging.error(f"Error updating metadata: {e}")
-        print(f"Error updating metadata: {e}")
-        raise e
+    extraction_stats["calls"] += 1
+    extraction_stats["users"] += 1
+    with tracer.span("metadata", "extract", users=1) as attributes:
+        result = await metadata_agent.ainvoke([SystemMessage(prompt_template), HumanMessage(context)])
+        attributes.update(message_usage(result.get("raw")))
+    logging.info(f"Metadata {result.get('parsed')} extracted")
+    return await apply_update(user_id, metadata, parse_update(result), metadata_manager)
+
+
+async def process_histories(batch: list, metadata_manager: MetadataManager):
+    '''Extracts several users' (user_id, turns) deltas with a single LLM call'''
+    # One entry per user: two sessions of the same user would otherwise each merge into the same
+    # base metadata, and whichever was applied last would drop the other's update
+    merged = {}
+    for user_id, turns in batch:
+        if turns:
+            merged.setdefault(user_id, []).extend(turns)
+    batch = list(merged.items())
+    if len(batch) <= 1:
+        return [await process_history(user_id, turns, metadata_manager) for user_id, turns in batch]
+    async with metadata_manager.extracting(merged):
+        return await extract_histories(batch, metadata_manager)
+
+
+async def extract_histories(batch: list, metadata_manager: MetadataManager):
+    '''process_histories for distinct users whose extraction locks are already held'''
+    keyed = {}
+    blocks = []
+    for index, (user_id, turns) in enumerate(batch, start=1):
+        metadata = await metadata_manager.get_metadata(user_id)
+        keyed[f"user_{index}"] = (user_id, turns, metadata)
+        blocks.append(f"""
+    ### user_{index}
+    User Metadata:
+    {compact_metadata(metadata)}
+
+    New Chat Turns:
+    {format_turns(turns)}
+    """)
+
+    extraction_stats["calls"] += 1
+    extraction_stats["batch_calls"] += 1
+    extraction_stats["users"] += len(batch)
+    with tracer.span("metadata", "extract_batch", users=len(batch)) as attributes:
+        result = await batch_metadata_agent.ainvoke([SystemMessage(batch_prompt_template), HumanMessage("\n".join(blocks))])
+        attributes.update(message_usage(result.get("raw")))
+
+    if result.get("parsed") is not None:
+        updates = [update.model_dump(exclude_unset=True) for update in result["parsed"].updates]
+    else:
+        updates = raw_arguments(result.get("raw")).get("updates") or []
+        updates = [update for update in updates if isinstance(update, dict)]
+        if updates:
+            extraction_stats["salvaged"] += 1
+    by_key = {update.get("user_key"): clean_fields(update) for update in updates}
+
+    results = []
+    for key, (user_id, turns, metadata) in keyed.items():
+        if key in by_key:
+            results.append(await apply_update(user_id, metadata, by_key[key], metadata_manager))
+        else:
+            # The batch reply missed this user; fall back to extracting it on its own
+            results.append(await extract_history(user_id, turns, metadata_manager))
+    return results
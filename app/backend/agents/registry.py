@@ -0,0 +1,123 @@
+import time
+import asyncio
+import logging
+import importlib
+import threading
+
+# Worker agents by name -> (module, attribute). Modules are only imported on first use,
+# since importing one opens its index and builds its LLM client.
+AGENT_MODULES = {
+    "initial_stress_agent": ("app.backend.agents.initial_stress_agent", "init_stress_agent"),
+    "decision_maker_agent": ("app.backend.agents.decision_maker_agent", "decision_maker_agent"),
+    "indecision_analyst_agent": ("app.backend.agents.indecision_analyst_agent", "indecision_analyst_agent"),
+    "lifestyle_coach_agent": ("app.backend.agents.lifestyle_coach_agent", "lifestyle_coach_agent"),
+    "general_chat_agent": ("app.backend.agents.general_chat_agent", "general_chat_agent"),
+}
+SUPERVISOR = "supervisor"
+
+
+def build_response_models():
+    '''Finishes building the OpenAI SDK's response models before any request needs them.
+
+    They are declared with defer_build, and pydantic's deferred build is not thread-safe. langchain
+    dumps chat completions on executor threads, so when the first replies after startup arrive
+    together, a dump can run against a half-built model and come back as {} (KeyError: 'choices').
+    '''
+    from openai.types import CreateEmbeddingResponse
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+    for model in (ChatCompletion, ChatCompletionChunk, CreateEmbeddingResponse):
+        model.model_rebuild(force=True)
+
+
+class AgentRegistry:
+    '''Builds each worker agent and the supervisor on first use or during background warm-up'''
+
+    def __init__(self, agent_modules=AGENT_MODULES):
+        self.agent_modules = agent_modules
+        self.agents = {}
+        self.orchestrator = None
+        self.checkpointer = None  # set by the app before warm-up; None keeps threads in memory
+        self.warmup_seconds = {}
+        self.errors = {}
+        self.locks = {name: threading.Lock() for name in [*agent_modules, SUPERVISOR]}
+        self.warmup_started = None
+        self.warmup_finished = None
+
+    def get(self, name: str):
+        if name in self.agents:
+            return self.agents[name]
+        with self.locks[name]:
+            if name not in self.agents:
+                module_name, attribute = self.agent_modules[name]
+                start = time.perf_counter()
+                try:
+                    agent = getattr(importlib.import_module(module_name), attribute)
+                except Exception as e:
+                    self.errors[name] = repr(e)
+                    raise
+                self.warmup_seconds[name] = round(time.perf_counter() - start, 3)
+                self.errors.pop(name, None)
+                self.agents[name] = agent
+                print(f"{name} loaded in {self.warmup_seconds[name]}s")
+        return self.agents[name]
+
+    def get_orchestrator(self):
+        if self.orchestrator is not None:
+            return self.orchestrator
+        with self.locks[SUPERVISOR]:
+            if self.orchestrator is None:
+                workers = [self.get(name) for name in self.agent_modules]
+                start = time.perf_counter()
+                try:
+                    from app.backend.agents.supervisor_agent import build_orchestrator
+                    self.orchestrator = build_orchestrator(workers, self.checkpointer)
+                except Exception as e:
+                    self.errors[SUPERVISOR] = repr(e)
+                    raise
+                self.warmup_seconds[SUPERVISOR] = round(time.perf_counter() - start, 3)
+                self.errors.pop(SUPERVISOR, None)
+        return self.orchestrator
+
+    async def aget(self, name: str):
+        if name in self.agents:
+            return self.agents[name]
+        return await asyncio.to_thread(self.get, name)
+
+    async def aget_orchestrator(self):
+        if self.orchestrator is not None:
+            return self.orchestrator
+        return await asyncio.to_thread(self.get_orchestrator)
+
+    async def warm_up(self):
+        '''Loads every agent concurrently off the event loop, then compiles the supervisor'''
+        self.warmup_started = time.time()
+        build_response_models()
+        results = await asyncio.gather(*(self.aget(name) for name in self.agent_modules),
+                                       return_exceptions=True)
+        for name, result in zip(self.agent_modules, results):
+            if isinstance(result, Exception):
+                logging.error(f"Warm-up failed for {name}: {result}")
+        if not self.errors:
+            try:
+                await self.aget_orchestrator()
+            except Exception as e:
+                logging.error(f"Warm-up failed for {SUPERVISOR}: {e}")
+        self.warmup_finished = time.time()
+        print(f"Agent warm-up finished: {self.report()}")
+
+    def ready(self) -> bool:
+        return self.orchestrator is not None
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready(),
+            "loaded": sorted(self.agents),
+            "pending": sorted(set(self.agent_modules) - set(self.agents)),
+            "warmup_seconds": dict(self.warmup_seconds),
+            "errors": dict(self.errors),
+            "warmup_total_seconds": round(self.warmup_finished - self.warmup_started, 3)
+            if self.warmup_started and self.warmup_finished else None,
+        }
+
+
+registry = AgentRegistry()
@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+from app.backend.storage.models import UserMetadata, EXTRACTED_FIELDS
+
+# Load environment variables
+load_dotenv()
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", 0.95))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 60 * 60))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 5000))
+RESPONSE_CACHE_AGENTS = os.getenv(
+    "RESPONSE_CACHE_AGENTS",
+    "initial_stress_agent,decision_maker_agent,indecision_analyst_agent,lifestyle_coach_agent",
+)
+
+
+def metadata_fingerprint(metadata: UserMetadata) -> str:
+    '''Hash of the metadata fields that shape an answer, so users with different triggers never share one'''
+    fields = {field: sorted(item.lower() for item in getattr(metadata, field)) for field in EXTRACTED_FIELDS}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+class SemanticResponseCache:
+    '''Answers near-duplicate queries from users with the same metadata without calling the supervisor.
+
+    Entries are grouped by metadata fingerprint; a lookup embeds the query and returns the most
+    similar unexpired entry in its group if the cosine similarity clears the threshold.
+    '''
+
+    def __init__(self, embeddings=None, enabled: bool = RESPONSE_CACHE_ENABLED,
+                 threshold: float = RESPONSE_CACHE_THRESHOLD, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, agents: str = RESPONSE_CACHE_AGENTS):
+        self._embeddings = embeddings
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.agents = {agent.strip() for agent in agents.split(",") if agent.strip()}
+        self.entries = OrderedDict()  # entry id -> (fingerprint, vector, agent, response, created_at)
+        self.buckets = {}  # fingerprint -> (entry ids, stacked vectors or None when stale)
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.agent_hits = {}
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            from app.backend.rag.embedding_cache import get_embeddings
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    async def embed(self, query: str):
+        vector = np.asarray(await asyncio.to_thread(self.embeddings.embed_query, query), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    async def lookup(self, query: str, fingerprint: str):
+        '''Returns (vector, agent, response); agent and response are None on a miss'''
+        vector = await self.embed(query)
+        ids, matrix = self._bucket(fingerprint)
+        if ids:
+            scores = matrix @ vector
+            for index in np.argsort(-scores):
+                if scores[index] < self.threshold:
+                    break
+                _, _, agent, response, created_at = self.entries[ids[index]]
+                if time.time() - created_at <= self.ttl_seconds:
+                    self.entries.move_to_end(ids[index])
+                    self.hits += 1
+                    self.agent_hits[agent] = self.agent_hits.get(agent, 0) + 1
+                    return vector, agent, response
+        self.misses += 1
+        return vector, None, None
+
+    def store(self, vector, fingerprint: str, agent: str, response: str):
+        if agent not in self.agents or not response:
+            return
+        entry_id = self.next_id
+        self.next_id += 1
+        self.entries[entry_id] = (fingerprint, vector, agent, response, time.time())
+        self.buckets.setdefault(fingerprint, ([], None))[0].append(entry_id)
+        self.buckets[fingerprint] = (self.buckets[fingerprint][0], None)
+        self.stores += 1
+        self._evict()
+
+    def _bucket(self, fingerprint: str):
+        ids, matrix = self.buckets.get(fingerprint, ([], None))
+        if ids and matrix is None:
+            matrix = np.stack([self.entries[entry_id][1] for entry_id in ids])
+            self.buckets[fingerprint] = (ids, matrix)
+        return ids, matrix
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl_seconds
+        while self.entries:
+            entry_id, (fingerprint, _, _, _, created_at) = next(iter(self.entries.items()))
+            if len(self.entries) <= self.max_entries and created_at >= cutoff:
+                break
+            del self.entries[entry_id]
+            ids = [i for i in self.buckets[fingerprint][0] if i != entry_id]
+            if ids:
+                self.buckets[fingerprint] = (ids, None)
+            else:
+                del self.buckets[fingerprint]
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "hits_by_agent": dict(self.agent_hits),
+        }
+
+
+response_cache = SemanticResponseCache()
@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import math
+import time
+import argparse
+import asyncio
+from collections import Counter
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Local fast-path router: a lexical TF-IDF nearest-centroid classifier trained on labelled example
+# utterances per agent. Confident messages go straight to that agent; the rest fall back to the
+# LLM supervisor.
+# Evaluate: python -m app.backend.agents.router [--dataset labelled.json] [--measure-supervisor]
+
+# Load environment variables
+load_dotenv()
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+ROUTER_EXAMPLES_PATH = os.getenv("ROUTER_EXAMPLES_PATH", str(Path(__file__).with_name("routing_examples.json")))
+ROUTER_MIN_SCORE = float(os.getenv("ROUTER_MIN_SCORE", 0.2))
+ROUTER_MIN_MARGIN = float(os.getenv("ROUTER_MIN_MARGIN", 0.06))
+
+SUFFIXES = ("ing", "ed", "es", "s", "ly")
+
+
+def stem(word: str) -> str:
+    word = word.split("'")[0]
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> list:
+    '''Stemmed unigrams plus bigrams'''
+    words = [stem(word) for word in re.findall(r"[a-z']+", text.lower())]
+    words = [word for word in words if word]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def load_examples(path: str = ROUTER_EXAMPLES_PATH) -> dict:
+    '''{agent: [utterance, ...]}'''
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Router:
+    '''Nearest-centroid classifier over sparse TF-IDF vectors.
+
+    route() returns the agent whose centroid is most similar to the message, or None when the best
+    score is below min_score or too close to the runner-up, so the supervisor decides instead.
+    '''
+
+    def __init__(self, examples: dict, min_score: float = ROUTER_MIN_SCORE,
+                 min_margin: float = ROUTER_MIN_MARGIN, enabled: bool = ROUTER_ENABLED):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.enabled = enabled
+        documents = [(agent, Counter(tokenize(text))) for agent, texts in examples.items() for text in texts]
+        document_frequency = Counter(term for _, counts in documents for term in counts)
+        self.idf = {term: math.log((1 + len(documents)) / (1 + df)) + 1 for term, df in document_frequency.items()}
+
+        sums = {agent: Counter() for agent in examples}
+        for agent, counts in documents:
+            for term, weight in self.vector(counts).items():
+                sums[agent][term] += weight
+        self.centroids = {agent: self.normalize(vector) for agent, vector in sums.items()}
+        self.routed = Counter()
+        self.fallbacks = 0
+        self.classify_seconds = 0.0
+
+    @staticmethod
+    def normalize(vector: dict) -> dict:
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {term: weight / norm for term, weight in vector.items()}
+
+    def vector(self, counts: Counter) -> dict:
+        # Terms never seen in training carry no routing signal
+        return self.normalize({term: (1 + math.log(count)) * self.idf[term]
+                               for term, count in counts.items() if term in self.idf})
+
+    def scores(self, text: str) -> list:
+        '''[(score, agent)] sorted best first'''
+        vector = self.vector(Counter(tokenize(text)))
+        return sorted(((sum(weight * centroid.get(term, 0.0) for term, weight in vector.items()), agent)
+                       for agent, centroid in self.centroids.items()), reverse=True)
+
+    def classify(self, text: str):
+        '''(agent or None, best score, margin over the runner-up)'''
+        ranked = self.scores(text)
+        best_score, agent = ranked[0]
+        margin = best_score - (ranked[1][0] if len(ranked) > 1 else 0.0)
+        if best_score < self.min_score or margin < self.min_margin:
+            return None, best_score, margin
+        return agent, best_score, margin
+
+    def route(self, text: str):
+        '''The agent to call directly, or None to let the supervisor decide'''
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        agent, _, _ = self.classify(text)
+        self.classify_seconds += time.perf_counter() - start
+        if agent is None:
+            self.fallbacks += 1
+        else:
+            self.routed[agent] += 1
+        return agent
+
+    def stats(self) -> dict:
+        decisions = sum(self.routed.values()) + self.fallbacks
+        return {
+            "enabled": self.enabled,
+            "routed": dict(self.routed),
+            "fallbacks": self.fallbacks,
+            "fast_path_rate": sum(self.routed.values()) / decisions if decisions else 0.0,
+            "avg_classify_ms": self.classify_seconds / decisions * 1000 if decisions else 0.0,
+        }
+
+
+router = Router(load_examples())
+
+
+## OFFLINE EVALUATION ##
+
+async def supervisor_hop(texts: list) -> list:
+    '''Times the supervisor's routing LLM call for each text: [(agent it handed off to, seconds)]'''
+    from langchain_core.messages import SystemMessage, HumanMessage
+    from langgraph_supervisor.handoff import create_handoff_tool
+    from app.backend.agents.registry import AGENT_MODULES
+    from app.backend.agents.supervisor_agent import llm, prompt_template
+
+    model = llm.bind_tools([create_handoff_tool(agent_name=name) for name in AGENT_MODULES])
+    results = []
+    for text in texts:
+        start = time.perf_counter()
+        reply = await model.ainvoke([SystemMessage(prompt_template), HumanMessage(text)])
+        elapsed = time.perf_counter() - start
+        calls = reply.tool_calls
+        results.append((calls[0]["name"].removeprefix("transfer_to_") if calls else None, elapsed))
+    return results
+
+
+def evaluate(examples: dict, dataset: dict = None):
+    '''Routes every labelled utterance, with leave-one-out over the training examples when no
+    separate dataset is given: [(text, label, routed agent or None, top-scoring agent, score, margin, seconds)]'''
+    rows = []
+    if dataset is not None:
+        model = Router(examples, enabled=True)
+        cases = [(model, text, agent) for agent, texts in dataset.items() for text in texts]
+    else:
+        cases = []
+        for agent, texts in examples.items():
+            for index, text in enumerate(texts):
+                held_out = dict(examples, **{agent: texts[:index] + texts[index + 1:]})
+                cases.append((Router(held_out, enabled=True), text, agent))
+    for model, text, label in cases:
+        start = time.perf_counter()
+        predicted, score, margin = model.classify(text)
+        elapsed = time.perf_counter() - start
+        rows.append((text, label, predicted, model.scores(text)[0][1], score, margin, elapsed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the local fast-path router")
+    parser.add_argument("--examples", default=ROUTER_EXAMPLES_PATH, help="training utterances per agent")
+    parser.add_argument("--dataset", help="held-out utterances per agent (default: leave-one-out over --examples)")
+    parser.add_argument("--measure-supervisor", action="store_true",
+                        help="time the real supervisor routing call for each utterance (needs OPENAI_API_KEY)")
+    parser.add_argument("--supervisor-ms", type=float, default=1000.0,
+                        help="assumed supervisor routing latency when not measured (default: 1000)")
+    parser.add_argument("--errors", action="store_true", help="list misrouted utterances")
+    args = parser.parse_args(argv)
+
+    examples = load_examples(args.examples)
+    dataset = load_examples(args.dataset) if args.dataset else None
+    rows = evaluate(examples, dataset)
+
+    total = len(rows)
+    routed = [row for row in rows if row[2] is not None]
+    correct = [row for row in routed if row[2] == row[1]]
+    router_seconds = sum(row[6] for row in rows)
+    print(f"Utterances: {total}  (min_score={ROUTER_MIN_SCORE}, min_margin={ROUTER_MIN_MARGIN})")
+    print(f"Fast path:  {len(routed)}/{total} ({len(routed) / total:.1%}) routed locally, "
+          f"{total - len(routed)} fall back to the supervisor")
+    print(f"Accuracy:   {len(correct)}/{len(routed)} ({len(correct) / len(routed) if routed else 0:.1%}) of routed, "
+          f"top-1 {sum(row[3] == row[1] for row in rows) / total:.1%} on all")
+
+    print(f"\n{'agent':<26}{'n':>4}{'routed':>8}{'correct':>9}")
+    for agent in sorted({row[1] for row in rows}):
+        agent_rows = [row for row in rows if row[1] == agent]
+        print(f"{agent:<26}{len(agent_rows):>4}{sum(row[2] is not None for row in agent_rows):>8}"
+              f"{sum(row[2] == agent for row in agent_rows):>9}")
+
+    if args.measure_supervisor:
+        hops = asyncio.run(supervisor_hop([row[0] for row in rows]))
+        supervisor_seconds = sum(seconds for _, seconds in hops) / len(hops)
+        agreement = sum(hop_agent == row[1] for (hop_agent, _), row in zip(hops, rows)) / total
+        print(f"\nSupervisor: {supervisor_seconds * 1000:.0f} ms per routing call (measured), "
+              f"{agreement:.1%} agree with the labels")
+    else:
+        supervisor_seconds = args.supervisor_ms / 1000
+        print(f"\nSupervisor: {args.supervisor_ms:.0f} ms per routing call (assumed; pass --measure-supervisor)")
+
+    saved = len(routed) * supervisor_seconds - router_seconds
+    print(f"Router:     {router_seconds / total * 1000:.3f} ms per message")
+    print(f"Saved:      {saved:.1f}s over {total} messages ({saved / total * 1000:.0f} ms per message on average)")
+
+    if args.errors:
+        print()
+        for text, label, predicted, _, score, margin, _ in rows:
+            if predicted is not None and predicted != label:
+                print(f"  {label} -> {predicted} ({score:.2f}, +{margin:.2f}): {text}")
+
+
+if __name__ == "__main__":
+    main()
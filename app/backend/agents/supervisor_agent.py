@@ -1,11 +1,6 @@
 import os
 from dotenv import load_dotenv
 from langgraph_supervisor import create_supervisor
-from app.backend.agents.lifestyle_coach_agent import lifestyle_coach_agent
-from app.backend.agents.initial_stress_agent import init_stress_agent
-from app.backend.agents.decision_maker_agent import decision_maker_agent
-from app.backend.agents.indecision_analyst_agent import indecision_analyst_agent
-from app.backend.agents.general_chat_agent import general_chat_agent
 from app.backend.storage.session_managing import MetadataManager
 from langchain_openai import ChatOpenAI
 from langgraph.checkpoint.memory import InMemorySaver
@@ -17,7 +12,8 @@ print("Supervisor agent loaded")
 load_dotenv()
 key = os.getenv("OPENAI_API_KEY")
 
-llm = ChatOpenAI(model_name="gpt-4o", temperature=0,api_key=key)
+# stream_usage reports token counts on streamed replies too, for the per-stage token metrics
+llm = ChatOpenAI(model_name="gpt-4o", temperature=0, api_key=key, stream_usage=True)
 
 prompt_template = ('''
             You are a team supervisor managing an initial stress agent,
@@ -39,21 +35,21 @@ prompt_template = ('''
 
 print("Template created")
 
-supervisor = create_supervisor(
-    [init_stress_agent,
-     decision_maker_agent,
-     indecision_analyst_agent,
-     lifestyle_coach_agent,
-     general_chat_agent,],
-     model=llm,
-     prompt=prompt_template,
-     output_mode="last_message"
-)
-print("Supervisor agent created")
+# Worker agents and the checkpointer are passed in by the agent registry so importing this module stays cheap
+def build_orchestrator(workers, checkpointer=None):
+    supervisor = create_supervisor(
+        workers,
+        model=llm,
+        prompt=prompt_template,
+        output_mode="last_message"
+    )
+    print("Supervisor agent created")
+
+    return supervisor.compile(
+        # Conversation threads persist in the app's SQLite checkpointer; in memory when run standalone
+        checkpointer=checkpointer or InMemorySaver(),
+    )
 
-orchestrator = supervisor.compile(
-    checkpointer=InMemorySaver(),
-)
 chat_history = {}
 config = {"thread_id": 123456}
 '''
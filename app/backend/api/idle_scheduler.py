@@ -0,0 +1,111 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+IDLE_AFTER_SECONDS = float(os.getenv("IDLE_AFTER_SECONDS", 5 * 60))
+
+
+class IdleScheduler:
+    '''Calls handler(key) once a key has seen no activity for idle_after seconds.
+
+    Keeps at most one timer per key in a heap: a touch only records the new activity time,
+    and a timer that fires early is pushed back to the key's real deadline. Due jobs go to a
+    queue drained by max_concurrent workers, so only idle keys cost anything.
+    '''
+
+    def __init__(self, handler, idle_after: float = IDLE_AFTER_SECONDS, max_concurrent: int = 1):
+        self.handler = handler
+        self.idle_after = idle_after
+        self.max_concurrent = max_concurrent
+        self.last_activity = {}
+        self.scheduled = {}  # key -> deadline of its heap entry
+        self.heap = []
+        self.jobs = asyncio.Queue()
+        self.wakeup = asyncio.Event()
+        self.tasks = []
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    def touch(self, key):
+        now = time.time()
+        self.last_activity[key] = now
+        if key not in self.scheduled:
+            self._schedule(key, now + self.idle_after)
+
+    def forget(self, key):
+        self.last_activity.pop(key, None)
+
+    def _schedule(self, key, deadline: float):
+        self.scheduled[key] = deadline
+        heapq.heappush(self.heap, (deadline, key))
+        if self.heap[0][1] == key:
+            self.wakeup.set()
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._timer())]
+        self.tasks += [asyncio.create_task(self._worker()) for _ in range(self.max_concurrent)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def _timer(self):
+        while True:
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                deadline, key = heapq.heappop(self.heap)
+                del self.scheduled[key]
+                last_activity = self.last_activity.get(key)
+                if last_activity is None:
+                    continue  # forgotten
+                idle_at = last_activity + self.idle_after
+                if idle_at > now:
+                    self._schedule(key, idle_at)  # active since this timer was set
+                else:
+                    del self.last_activity[key]
+                    self.jobs.put_nowait((key, idle_at))
+
+            self.wakeup.clear()
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            key, idle_at = await self.jobs.get()
+            lag = time.time() - idle_at
+            self.total_lag_seconds += lag
+            self.max_lag_seconds = max(self.max_lag_seconds, lag)
+            self.running += 1
+            try:
+                await self.handler(key)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Idle job for {key} failed: {e}", exc_info=True)
+            finally:
+                self.running -= 1
+                self.jobs.task_done()
+
+    def stats(self) -> dict:
+        started = self.completed + self.failed + self.running
+        return {
+            "tracked": len(self.last_activity),
+            "backlog": self.jobs.qsize(),
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_lag_seconds": self.total_lag_seconds / started if started else 0.0,
+            "max_lag_seconds": self.max_lag_seconds,
+        }
@@ -1,44 +1,40 @@
 import logging
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from app.backend.storage.models import UserMetadata
 from app.backend.storage.session_managing import MetadataManager
-from app.backend.agents.supervisor_agent import orchestrator
-from app.backend.agents.metadata_agent import metadata_agent, process_history
-from app.backend.agents.supervisor_agent import orchestrator
-from motor.motor_asyncio import AsyncIOMotorClient
-from langchain_core.messages import AIMessage, ToolMessage
+from app.backend.storage.sessions import Session, SessionStore
+from app.backend.storage.database import get_database, init_database, close_database
+from app.backend.agents.registry import registry
+from app.backend.agents.response_cache import response_cache, metadata_fingerprint
+from app.backend.agents.router import router
+from app.backend.agents.context_builder import context_builder
+from app.backend.tracing import tracer, TracingMiddleware, PROMETHEUS_CONTENT_TYPE
+from app.backend.api.passwords import password_hasher, PasswordHasherBusy
+from app.backend.api.idle_scheduler import IdleScheduler
+from app.backend.storage.job_queue import JobQueue
+from app.backend.storage.checkpoints import open_checkpointer
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.graph.message import add_messages
+from pymongo.errors import DuplicateKeyError
 from pydantic import BaseModel
 from uuid import uuid4
-from passlib.context import CryptContext
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import os
+import json
+import time
 import uvicorn
 import asyncio
-from beanie import init_beanie
 import ssl
 
 # Load environment variables
 load_dotenv()
-MONGO_URL = os.getenv("MONGO_URI")
-
-# MongoDB setup
-client = AsyncIOMotorClient(
-    MONGO_URL,
-    tls=True,
-    tlsAllowInvalidCertificates=True,
-    tlsAllowInvalidHostnames=True,
-    serverSelectionTimeoutMS=5000,
-    connectTimeoutMS=5000,
-    maxPoolSize=1,
-    retryWrites=False
-)
-db = client["lulullm"]
-user_collection = db["users"]
 
-# Password hashing setup
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# MongoDB setup (one pooled client shared with Beanie)
+db = get_database()
+user_collection = db["users"]
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -48,6 +44,7 @@ class UserCreate(BaseModel):
 class UserResponse(BaseModel):
     username: str
     user_id: str
+    session_token: str
 
 # FastAPI app
 app = FastAPI()
@@ -58,15 +55,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-# Initialize MongoDB connection
-async def init_database():
-    client = AsyncIOMotorClient(MONGO_URL)  # Use AsyncIOMotorClient for async operations
-    await init_beanie(
-        database=client.lulullm,
-        document_models=[UserMetadata],
-    )
-    return client.lulullm  # Return the database instance
+# Per-request trace and latency metrics; the request ID is returned in the X-Request-ID header
+app.add_middleware(TracingMiddleware, tracer=tracer)
 
 @app.on_event("startup")
 async def startup_event():
@@ -74,140 +64,391 @@ async def startup_event():
     global metadata_manager
     db = await init_database()
     metadata_manager = MetadataManager()
+    # Persist metadata updates in batches in the background
+    asyncio.create_task(metadata_manager.run_flusher())
+
+    # Conversation threads live in SQLite with a TTL and a per-thread checkpoint cap, compacted periodically
+    registry.checkpointer = await open_checkpointer()
+    asyncio.create_task(registry.checkpointer.run_compactor())
+
+    # Load agents in the background so the app can serve /healthz right away
+    asyncio.create_task(registry.warm_up())
+
+    # Queue metadata extraction per session as each one goes idle; the job queue runs it
+    job_queue.start()
+    idle_scheduler.start()
+    asyncio.create_task(evict_expired())
 
-    # Start background task to check user idle status
-    asyncio.create_task(check_user_idle())
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Write any metadata still waiting in the write-behind queue
+    await idle_scheduler.stop()
+    await job_queue.stop()
+    await metadata_manager.close()
+    await registry.checkpointer.conn.close()
+    close_database()
+    password_hasher.shutdown()
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the API!"}
 
+# Reject sign-ins while the bcrypt pool is saturated instead of queueing without bound
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "1"})
+
+# Admin endpoints require the ADMIN_TOKEN header value
+def require_admin(x_admin_token: str = Header(None)):
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or x_admin_token != admin_token:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+# Background job queue depth, latency and recent dead letters
+@app.get("/admin/jobs", dependencies=[Depends(require_admin)])
+def admin_jobs():
+    return {"stats": job_queue.stats(), "dead_letters": job_queue.dead_letters()}
+
+# Hit rates and sizes of the in-process caches and pools
+@app.get("/admin/stats", dependencies=[Depends(require_admin)])
+async def admin_stats():
+    from app.backend.rag.retrieval import retrieval_service
+    return {
+        "response_cache": response_cache.stats(),
+        "router": router.stats(),
+        "context": context_builder.stats(),
+        "retrieval": retrieval_service.stats(),
+        "metadata": metadata_manager.stats(),
+        "sessions": len(session_store),
+        "checkpoints": await registry.checkpointer.stats(),
+        "idle_scheduler": idle_scheduler.stats(),
+        "password_hasher": password_hasher.stats(),
+        "tracing": tracer.stats(),
+    }
+
+# Prometheus scrape target: per-stage latency histograms, error and token counters, HTTP latency by route
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(tracer.metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+# Recent request traces, newest first
+@app.get("/admin/traces", dependencies=[Depends(require_admin)])
+def admin_traces():
+    return tracer.summaries()
+
+# One request's spans (routing, agent hops, LLM and tool calls, retrieval, DB ops) by its X-Request-ID
+@app.get("/admin/traces/{request_id}", dependencies=[Depends(require_admin)])
+def admin_trace(request_id: str):
+    trace = tracer.get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+# Liveness probe: the process is up
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+# Readiness probe: every agent index is loaded and the supervisor is compiled
+@app.get("/readyz")
+def readyz():
+    report = registry.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+# Per-user sessions, resolved from the signed token returned by signup/signin
+session_store = SessionStore()
+
+async def current_session(authorization: str = Header(None)) -> Session:
+    token = authorization.removeprefix("Bearer ").strip() if authorization else None
+    session = session_store.get(token) if token else None
+    if session is None:
+        raise HTTPException(status_code=401, detail="User not signed in")
+    idle_scheduler.touch(session.session_id)
+    return session
+
 # Sign-up endpoint
-chat_history = {}
-config = {}
 @app.post("/signup", response_model=UserResponse)
 async def signup(user: UserCreate):
-    global chat_history, config
     # Check if username already exists
-    existing_user = await user_collection.find_one({"username": user.username})
+    with tracer.span("db", "users.find_one"):
+        existing_user = await user_collection.find_one({"username": user.username})
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
     
     # Hash the password and create a new user
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     user_id = str(uuid4())
     new_user = {"username": user.username, "password_hash": hashed_password, "user_id": user_id}
-    await user_collection.insert_one(new_user)
-    chat_history['user_id'] = existing_user['user_id']
-    config['thread_id'] = str(uuid4())
-    print(f"User's chat history {chat_history} loaded")
-    print(chat_history['user_id'])
-    return {"username": user.username, "user_id": user_id}
+    try:
+        with tracer.span("db", "users.insert_one"):
+            await user_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        # A concurrent signup took the username between the check and the insert
+        raise HTTPException(status_code=400, detail="Username already exists")
+    token, session = session_store.create(user_id, thread_id=str(uuid4()))
+    print(f"Session started for user {user_id}")
+    return {"username": user.username, "user_id": user_id, "session_token": token}
 
 # Sign-in endpoint
 @app.post("/signin", response_model=UserResponse)
 async def signin(user: UserCreate):
-    global chat_history, config
     # Check if username exists
-    existing_user = await user_collection.find_one({"username": user.username})
+    with tracer.span("db", "users.find_one"):
+        existing_user = await user_collection.find_one({"username": user.username})
     if not existing_user:
         raise HTTPException(status_code=400, detail="Invalid username or password")
     
     # Verify the password
-    if not pwd_context.verify(user.password, existing_user["password_hash"]):
+    if not await password_hasher.verify(user.password, existing_user["password_hash"]):
         raise HTTPException(status_code=400, detail="Invalid username or password")
     
-    chat_history['user_id'] = existing_user['user_id']
-    config['thread_id'] = str(uuid4())
-    print(f"User's chat history {chat_history} loaded")
-    print(chat_history['user_id'])
-    return {"username": existing_user["username"], "user_id": existing_user["user_id"]}
+    token, session = session_store.create(existing_user["user_id"], thread_id=str(uuid4()))
+    print(f"Session started for user {existing_user['user_id']}")
+    return {"username": existing_user["username"], "user_id": existing_user["user_id"], "session_token": token}
+
+# The conversation so far, as checkpointed in the session's thread
+async def thread_messages(session: Session) -> list:
+    orchestrator = await registry.aget_orchestrator()
+    state = await orchestrator.aget_state(session.config)
+    return state.values.get("messages", [])
+
+# Messages for the new turn within the agent's token budget: the refreshed metadata and summary,
+# removals of turns already folded into the summary, and the user's message
+def build_input(session: Session, messages: list, metadata: UserMetadata, user_input: str, agent: str = None) -> list:
+    return context_builder.build(session.thread_id, messages, metadata, user_input, agent)
+
+# Semantic response cache (opt-in). Only a thread's first message is looked up,
+# since later answers depend on the conversation so far.
+async def lookup_cached_response(messages: list, user_input: str, metadata: UserMetadata):
+    if not response_cache.enabled or any(isinstance(message, HumanMessage) for message in messages):
+        return None, None, None
+    return await response_cache.lookup(user_input, metadata_fingerprint(metadata))
+
+async def record_turn(session: Session, turn: list, agent: str, response: str):
+    # Keep the supervisor thread in step so follow-up messages see exchanges it did not run itself
+    try:
+        orchestrator = await registry.aget_orchestrator()
+        await orchestrator.aupdate_state(session.config,
+                                         {"messages": [*turn, AIMessage(response, name=agent)]},
+                                         as_node="supervisor")
+    except Exception as e:
+        logging.warning(f"Could not record response in thread {session.thread_id}: {e}")
+
+# Local routing decision, timed as the "routing" stage alongside the supervisor's LLM calls
+def route(user_input: str):
+    with tracer.span("routing", "local_router") as attributes:
+        attributes["agent"] = router.route(user_input)
+    return attributes["agent"]
+
+# Records the run's agent hops, LLM calls and tool calls in the request's trace
+def traced_config(config: dict = None) -> dict:
+    return {**(config or {}), "callbacks": [tracer.callbacks(registry.agent_modules)]}
+
+# Fast path: messages the local router is confident about go straight to that agent,
+# skipping the supervisor's routing LLM call. The agent still sees the thread's history.
+async def invoke_routed(session: Session, agent_name: str, messages: list, turn: list):
+    agent = await registry.aget(agent_name)
+    response = await agent.ainvoke({"messages": add_messages(messages, turn)}, config=traced_config())
+    ai_message_content = response["messages"][-1].content
+    if ai_message_content:
+        await record_turn(session, turn, agent_name, ai_message_content)
+    return ai_message_content
 
 # Invoke endpoint
 @app.post("/invoke")
-async def invoke(user_input: str):
-    global chat_history, config
-    user_id = chat_history["user_id"]
-    metadata = await metadata_manager.get_metadata(user_id)
-    print(f"Metadata for user {user_id}: {metadata}")
-    # Create context-aware input
-    context = f"""
-    User Metadata:
-    {metadata.model_dump()}
-    
-    Chat History:
-    {user_input}
-    """
-    response = await orchestrator.ainvoke({"messages": context}, config=config)
-    # Extract the content of the AIMessage
-    ai_message_content = None
-    tool_message_count = 0
-    second_last_tool_message_index = None
-
-    # Iterate through messages in reverse order to find the second-to-last ToolMessage
-    for i, message in enumerate(reversed(response['messages'])):
-        if isinstance(message, ToolMessage):
-            tool_message_count += 1
-            if tool_message_count == 2:  # Found the second-to-last ToolMessage
-                # Calculate the index of the second-to-last ToolMessage in the original order
-                second_last_tool_message_index = len(response['messages']) - 1 - i
-                break
-
-    # If the second-to-last ToolMessage is found, get the next message
-    if second_last_tool_message_index is not None:
-        next_message_index = second_last_tool_message_index + 1
-        if next_message_index < len(response['messages']):
-            next_message = response['messages'][next_message_index]
-            if isinstance(next_message, AIMessage):  # Ensure it's an AIMessage
-                ai_message_content = next_message.content
+async def invoke(user_input: str, session: Session = Depends(current_session)):
+    metadata = await metadata_manager.get_metadata(session.user_id)
+    messages = await thread_messages(session)
+    query_vector, cached_agent, cached = await lookup_cached_response(messages, user_input, metadata)
+    if cached:
+        await record_turn(session, build_input(session, messages, metadata, user_input, cached_agent), cached_agent, cached)
+        session.add_turn(user_input, cached)
+        return cached
+
+    routed_agent = route(user_input)
+    turn = build_input(session, messages, metadata, user_input, routed_agent)
+    if routed_agent:
+        ai_message_content = await invoke_routed(session, routed_agent, messages, turn)
+    else:
+        orchestrator = await registry.aget_orchestrator()
+        response = await orchestrator.ainvoke({"messages": turn}, config=traced_config(session.config))
+        # Extract the content of the AIMessage
+        ai_message_content = None
+        tool_message_count = 0
+        second_last_tool_message_index = None
+
+        # Iterate through messages in reverse order to find the second-to-last ToolMessage
+        for i, message in enumerate(reversed(response['messages'])):
+            if isinstance(message, ToolMessage):
+                tool_message_count += 1
+                if tool_message_count == 2:  # Found the second-to-last ToolMessage
+                    # Calculate the index of the second-to-last ToolMessage in the original order
+                    second_last_tool_message_index = len(response['messages']) - 1 - i
+                    break
+
+        # If the second-to-last ToolMessage is found, get the next message
+        if second_last_tool_message_index is not None:
+            next_message_index = second_last_tool_message_index + 1
+            if next_message_index < len(response['messages']):
+                next_message = response['messages'][next_message_index]
+                if isinstance(next_message, AIMessage):  # Ensure it's an AIMessage
+                    ai_message_content = next_message.content
+                    routed_agent = next_message.name
     
     # Output the result
     if ai_message_content:
-        chat_history[user_input] = ai_message_content
+        session.add_turn(user_input, ai_message_content)
+        if query_vector is not None:
+            response_cache.store(query_vector, metadata_fingerprint(metadata), routed_agent, ai_message_content)
         return ai_message_content
     else:
         return ("No response generated.")
 
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-# Track user activity
-user_activity = {"last_activity": datetime.now(), "is_idle": False}
+# Streaming invoke endpoint: sends the routed agent's tokens as Server-Sent Events as they are generated
+@app.post("/invoke/stream")
+async def invoke_stream(user_input: str, session: Session = Depends(current_session)):
+
+    async def events():
+        start = time.perf_counter()
+        first_token_at = None
+        routed_agent = None
+        tokens = []
+        try:
+            metadata = await metadata_manager.get_metadata(session.user_id)
+            messages = await thread_messages(session)
+            query_vector, cached_agent, cached = await lookup_cached_response(messages, user_input, metadata)
+            if cached:
+                await record_turn(session, build_input(session, messages, metadata, user_input, cached_agent),
+                                  cached_agent, cached)
+                session.add_turn(user_input, cached)
+                yield sse_event("token", {"agent": cached_agent, "content": cached})
+                elapsed = round((time.perf_counter() - start) * 1000, 1)
+                yield sse_event("done", {"agent": cached_agent, "content": cached, "cached": True,
+                                         "time_to_first_token_ms": elapsed, "total_ms": elapsed})
+                return
+
+            fast_path_agent = route(user_input)
+            turn = build_input(session, messages, metadata, user_input, fast_path_agent)
+            if fast_path_agent:
+                worker = await registry.aget(fast_path_agent)
+                stream = worker.astream_events({"messages": add_messages(messages, turn)},
+                                               config=traced_config(), version="v2")
+            else:
+                orchestrator = await registry.aget_orchestrator()
+                stream = orchestrator.astream_events({"messages": turn}, config=traced_config(session.config),
+                                                     version="v2")
+            async for event in stream:
+                if event["event"] != "on_chat_model_stream":
+                    continue
+                # Top-level node of the graph that produced this token, e.g. "initial_stress_agent:<task id>|agent:<task id>"
+                agent = fast_path_agent or event["metadata"].get("langgraph_checkpoint_ns", "").split(":")[0]
+                if agent not in registry.agent_modules:
+                    continue  # supervisor routing tokens
+                content = event["data"]["chunk"].content
+                if not content or not isinstance(content, str):
+                    continue  # tool call chunks
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                routed_agent = agent
+                tokens.append(content)
+                yield sse_event("token", {"agent": agent, "content": content})
+        except Exception as e:
+            logging.error(f"Error streaming response: {e}", exc_info=True)
+            yield sse_event("error", {"detail": "Internal server error"})
+            return
+
+        ai_message_content = "".join(tokens)
+        if ai_message_content:
+            if fast_path_agent:
+                await record_turn(session, turn, fast_path_agent, ai_message_content)
+            session.add_turn(user_input, ai_message_content)
+            if query_vector is not None:
+                response_cache.store(query_vector, metadata_fingerprint(metadata), routed_agent, ai_message_content)
+        yield sse_event("done", {
+            "agent": routed_agent,
+            "content": ai_message_content or "No response generated.",
+            "cached": False,
+            "time_to_first_token_ms": round((first_token_at - start) * 1000, 1) if first_token_at else None,
+            "total_ms": round((time.perf_counter() - start) * 1000, 1),
+        })
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# Queue a metadata refactor carrying only the turns since the last extraction
+def queue_refactor(session: Session):
+    turns = metadata_manager.pending_turns(session)
+    if not turns:
+        return
+    print(f"Queueing metadata refactor for user {session.user_id} ({len(turns)} new turns)")
+    job_queue.enqueue("refactor_metadata",
+                      {"user_id": session.user_id, "session_id": session.session_id, "turns": turns},
+                      dedupe_key=session.session_id)
+
+# Once a session goes idle
+async def enqueue_refactor(session_id: str):
+    session = session_store.sessions.get(session_id)
+    if session is not None:
+        queue_refactor(session)
+
+# Shared cleanup for sessions dropped by expiry or by the store's size limit:
+# flush the turns not yet extracted, then drop the per-session state
+def release_session(session: Session):
+    queue_refactor(session)
+    idle_scheduler.forget(session.session_id)
+    metadata_manager.forget_session(session.session_id)
+    context_builder.forget(session.thread_id)
+
+session_store.on_evict = release_session
+
+# Refactor metadata (runs on the job queue's workers, retried on failure).
+# Small deltas from several users share one extraction call; large ones get their own.
+METADATA_BATCH_SIZE = int(os.getenv("METADATA_BATCH_SIZE", 8))
+METADATA_BATCH_MAX_CHARS = int(os.getenv("METADATA_BATCH_MAX_CHARS", 2000))
+
+async def refactor(jobs: list):
+    from app.backend.agents.metadata_agent import process_history, process_histories
+    small, large = [], []
+    for job in jobs:
+        size = sum(len(user_input) + len(response) for _, user_input, response in job["turns"])
+        (small if size <= METADATA_BATCH_MAX_CHARS else large).append(job)
+
+    def turns_of(job):
+        return [(user_input, response) for _, user_input, response in job["turns"]]
 
-# Refactor metadata
-async def refactor():
-    global chat_history, metadata_manager
-    print(chat_history)
-    user_id = chat_history["user_id"]
-    if not user_id:
-        raise HTTPException(status_code=400, detail="User not signed in")
-    
     try:
-        await process_history(user_id, chat_history, metadata_manager)
-        print(f"Metadata updated for user {user_id}")
-        return {"message": "Metadata updated successfully"}
+        if small:
+            await process_histories([(job["user_id"], turns_of(job)) for job in small], metadata_manager)
+        for job in large:
+            await process_history(job["user_id"], turns_of(job), metadata_manager)
     except Exception as e:
         logging.error(f"Error updating metadata: {e}")
         print(f"Error updating metadata: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+        raise
+    for job in jobs:
+        if job["session_id"] in session_store.sessions:  # released sessions need no bookkeeping
+            metadata_manager.mark_extracted(job["session_id"], job["turns"][-1][0])
+        print(f"Metadata updated for user {job['user_id']}")
+
+job_queue = JobQueue()
+job_queue.register("refactor_metadata", refactor, batch_size=METADATA_BATCH_SIZE)
+idle_scheduler = IdleScheduler(enqueue_refactor)
 
-# Check user idle status
-async def check_user_idle():
+# Periodically drop expired sessions and cached metadata
+async def evict_expired():
     while True:
         await asyncio.sleep(60)  # Check every minute
-        last_active = user_activity.get("last_activity")
-        if last_active and datetime.now() - last_active > timedelta(minutes=5):
-            # Trigger metadata refactor
-            if not user_activity["is_idle"]:
-                user_activity["is_idle"] = True
-                print("User is idle, triggering metadata refactor")
-                await refactor()
-
-# Middleware to update user activity
-@app.middleware("http")
-async def update_user_activity(request: Request, call_next):
-    user_activity["last_activity"] = datetime.now()  
-    user_activity["is_idle"] = False
-    response = await call_next(request)  
-    return response
+        try:
+            session_store.evict_expired()
+            metadata_manager.evict_expired()
+            job_queue.purge_done()
+        except Exception:
+            # Keep the loop alive; a failed pass is retried on the next tick
+            logging.exception("Periodic eviction failed")
 
 if __name__ == '__main__':
     import os
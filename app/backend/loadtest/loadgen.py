@@ -0,0 +1,192 @@
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import aiohttp
+from pathlib import Path
+from app.backend.agents.router import load_examples
+
+# Async load generator: each simulated user signs up, signs in and chats for a few turns.
+# Reports p50/p95/p99 latency, throughput and error rate per operation.
+# Usage: python -m app.backend.loadtest.loadgen [--base-url http://localhost:8000] [--users 50] [--turns 3]
+#        [--ramp-seconds 5] [--stream] [--json results.json]
+
+# Held-out utterances, none of them in the router's training examples, so the local fast path is hit
+# about as often as with real traffic
+MESSAGES_PATH = str(Path(__file__).with_name("messages.json"))
+
+
+def percentile(values: list, q: float):
+    '''Nearest-rank percentile of a sorted list'''
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, round(q / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}  # operation -> [(seconds, ok)]
+        self.errors = {}  # operation -> {reason: count}
+
+    def record(self, operation: str, seconds: float, ok: bool, reason: str = None):
+        self.samples.setdefault(operation, []).append((seconds, ok))
+        if not ok:
+            errors = self.errors.setdefault(operation, {})
+            errors[reason] = errors.get(reason, 0) + 1
+
+    def report(self, wall_seconds: float) -> dict:
+        operations = {}
+        for operation, samples in self.samples.items():
+            latencies = sorted(seconds * 1000 for seconds, ok in samples if ok)
+            failed = sum(not ok for _, ok in samples)
+            operations[operation] = {
+                "requests": len(samples),
+                "errors": failed,
+                "error_rate": failed / len(samples),
+                "throughput_rps": len(samples) / wall_seconds if wall_seconds else 0.0,
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+                "max_ms": latencies[-1] if latencies else None,
+                "error_reasons": self.errors.get(operation, {}),
+            }
+        total = sum(len(samples) for samples in self.samples.values())
+        failed = sum(not ok for samples in self.samples.values() for _, ok in samples)
+        return {
+            "wall_seconds": wall_seconds,
+            "requests": total,
+            "throughput_rps": total / wall_seconds if wall_seconds else 0.0,
+            "error_rate": failed / total if total else 0.0,
+            "operations": operations,
+        }
+
+
+async def timed(recorder: Recorder, operation: str, request):
+    '''Runs one request coroutine, recording its latency; returns its result or None on failure'''
+    start = time.perf_counter()
+    try:
+        result = await request
+    except Exception as e:
+        recorder.record(operation, time.perf_counter() - start, False, type(e).__name__)
+        return None
+    recorder.record(operation, time.perf_counter() - start, True)
+    return result
+
+
+async def checked(response_context):
+    async with response_context as response:
+        if response.status >= 400:
+            raise aiohttp.ClientResponseError(response.request_info, response.history,
+                                              status=response.status, message=await response.text())
+        return await response.json(content_type=None)
+
+
+async def streamed(recorder: Recorder, response_context):
+    '''Reads an /invoke/stream response, recording time to the first token event'''
+    start = time.perf_counter()
+    async with response_context as response:
+        if response.status >= 400:
+            raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status)
+        first_token = None
+        done = None
+        event = None
+        async for line in response.content:
+            line = line.decode("utf-8").strip()
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+                    recorder.record("invoke_stream_first_token", first_token, True)
+                elif event == "error":
+                    raise RuntimeError(line)
+                elif event == "done":
+                    done = json.loads(line[len("data: "):])
+        return done
+
+
+async def simulate_user(session: aiohttp.ClientSession, recorder: Recorder, base_url: str, run_id: str,
+                        index: int, turns: int, messages: list, stream: bool, think_seconds: float):
+    rng = random.Random(index)
+    credentials = {"username": f"load-{run_id}-{index}", "password": f"pw-{run_id}-{index}"}
+    if await timed(recorder, "signup", checked(session.post(f"{base_url}/signup", json=credentials))) is None:
+        return
+    signed_in = await timed(recorder, "signin", checked(session.post(f"{base_url}/signin", json=credentials)))
+    if signed_in is None:
+        return
+    headers = {"Authorization": f"Bearer {signed_in['session_token']}"}
+    for _ in range(turns):
+        params = {"user_input": rng.choice(messages)}
+        if stream:
+            request = streamed(recorder, session.post(f"{base_url}/invoke/stream", params=params, headers=headers))
+            await timed(recorder, "invoke_stream", request)
+        else:
+            await timed(recorder, "invoke", checked(session.post(f"{base_url}/invoke", params=params, headers=headers)))
+        if think_seconds:
+            await asyncio.sleep(rng.uniform(0, 2 * think_seconds))
+
+
+async def run(args) -> dict:
+    examples = load_examples(args.messages)
+    messages = [text for texts in examples.values() for text in texts]
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.users)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        start = time.perf_counter()
+
+        async def delayed(index):
+            # Spread user arrivals evenly over the ramp-up
+            await asyncio.sleep(args.ramp_seconds * index / args.users)
+            await simulate_user(session, recorder, args.base_url.rstrip("/"), run_id, index,
+                                args.turns, messages, args.stream, args.think_seconds)
+
+        await asyncio.gather(*(delayed(index) for index in range(args.users)))
+        wall_seconds = time.perf_counter() - start
+    report = recorder.report(wall_seconds)
+    report["config"] = {"users": args.users, "turns": args.turns, "ramp_seconds": args.ramp_seconds,
+                        "stream": args.stream, "think_seconds": args.think_seconds}
+    return report
+
+
+def print_report(report: dict):
+    print(f"{report['requests']} requests in {report['wall_seconds']:.1f}s: "
+          f"{report['throughput_rps']:.1f} req/s, {report['error_rate']:.1%} errors\n")
+    print(f"{'operation':<28}{'n':>6}{'err%':>7}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for operation, stats in report["operations"].items():
+        cells = [f"{stats[key]:>9.0f}" if stats[key] is not None else f"{'-':>9}"
+                 for key in ("p50_ms", "p95_ms", "p99_ms")]
+        print(f"{operation:<28}{stats['requests']:>6}{stats['error_rate']:>7.1%}{stats['throughput_rps']:>8.1f}"
+              + "".join(cells))
+    for operation, stats in report["operations"].items():
+        if stats["error_reasons"]:
+            print(f"  {operation} errors: {stats['error_reasons']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive concurrent simulated users through the API")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users (default: 20)")
+    parser.add_argument("--turns", type=int, default=3, help="chat messages per user (default: 3)")
+    parser.add_argument("--ramp-seconds", type=float, default=5.0, help="spread user arrivals over this long")
+    parser.add_argument("--think-seconds", type=float, default=0.0, help="mean pause between a user's messages")
+    parser.add_argument("--stream", action="store_true", help="chat through /invoke/stream instead of /invoke")
+    parser.add_argument("--messages", default=MESSAGES_PATH,
+                        help="utterances to send, as {label: [text, ...]} (default: a held-out set in loadtest/messages.json)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import os
+import re
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from app.backend.agents.router import router
+from app.backend.rag.embedding_providers import HashedNgramEmbeddings
+
+# Local stand-in for the OpenAI API so /signup, /signin and /invoke can be load tested offline.
+# Replies are deterministic: the supervisor hands off to the agent the local router picks, ReAct
+# agents call their tool once and then answer, and structured-output calls get schema-shaped
+# arguments. Only latency is random, drawn from a seeded distribution.
+# Usage: python -m app.backend.loadtest.stub_openai [--port 8001] [--latency-ms 500] [--latency-dist lognormal]
+# then run the backend with OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=stub
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", 500))
+STUB_LATENCY_DIST = os.getenv("STUB_LATENCY_DIST", "lognormal")
+STUB_LATENCY_JITTER = float(os.getenv("STUB_LATENCY_JITTER", 0.3))
+STUB_TOKEN_MS = float(os.getenv("STUB_TOKEN_MS", 10))
+STUB_RESPONSE_WORDS = int(os.getenv("STUB_RESPONSE_WORDS", 60))
+STUB_SEED = int(os.getenv("STUB_SEED", 0))
+
+WORDS = ("breathe slowly and notice what the stress is telling you then pick one small step you can "
+         "take today write down the options weigh what matters most and give yourself permission to "
+         "rest because clear decisions come easier when you are calm").split()
+
+
+class LatencyModel:
+    '''Time to first token in seconds: fixed, uniform or lognormal around mean_ms'''
+
+    def __init__(self, mean_ms: float, dist: str, jitter: float, seed: int):
+        self.mean = mean_ms / 1000
+        self.dist = dist
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.dist == "fixed" or self.mean <= 0:
+            return max(self.mean, 0.0)
+        if self.dist == "uniform":
+            return self.random.uniform(self.mean * (1 - self.jitter), self.mean * (1 + self.jitter))
+        # Lognormal with the given mean; jitter is the sigma of the underlying normal
+        mu = np.log(self.mean) - self.jitter ** 2 / 2
+        return self.random.lognormvariate(mu, self.jitter)
+
+
+def message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def user_text(messages: list) -> str:
+    '''The latest user message; metadata and history travel in separate messages'''
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return message_text(message)
+    return ""
+
+
+def reply_text(seed_text: str, words: int) -> str:
+    digest = int(hashlib.sha256(seed_text.encode("utf-8")).hexdigest(), 16)
+    start = digest % len(WORDS)
+    return " ".join(WORDS[(start + i) % len(WORDS)] for i in range(words)).capitalize() + "."
+
+
+def schema_arguments(schema: dict, text: str) -> dict:
+    '''Minimal arguments satisfying a tool's JSON schema; string fields get the user's text.
+
+    Optional fields are left out, like a model with nothing to say about them, so metadata
+    extraction doesn't reset every stored list on each load-test turn.
+    '''
+    arguments = {}
+    required = set(schema.get("required", []))
+    for name, spec in schema.get("properties", {}).items():
+        if name not in required:
+            continue
+        kind = spec.get("type")
+        if kind == "array":
+            items = spec.get("items", {})
+            if "$ref" in items:
+                items = schema.get("$defs", {}).get(items["$ref"].rsplit("/", 1)[-1], {})
+            # Batched metadata extraction: one (empty) update per "### <user_key>" block
+            keys = re.findall(r"^\s*### (\S+)", text, re.M) if "user_key" in items.get("properties", {}) else []
+            arguments[name] = [{"user_key": key} for key in keys]
+        elif kind == "object":
+            arguments[name] = {}
+        elif kind in ("integer", "number"):
+            arguments[name] = 0
+        elif kind == "boolean":
+            arguments[name] = False
+        else:
+            arguments[name] = text
+    return arguments
+
+
+def pick_tool(tools: list, tool_choice, text: str) -> dict:
+    functions = {tool["function"]["name"]: tool["function"] for tool in tools}
+    if isinstance(tool_choice, dict) and tool_choice.get("function", {}).get("name") in functions:
+        return functions[tool_choice["function"]["name"]]
+    handoffs = {name.removeprefix("transfer_to_"): name for name in functions if name.startswith("transfer_to_")}
+    if handoffs:
+        # Supervisor: hand off the way the local router would, falling back to its top-scoring agent
+        for _, agent in router.scores(text):
+            if agent in handoffs:
+                return functions[handoffs[agent]]
+    return next(iter(functions.values()))
+
+
+def completion(request: dict) -> dict:
+    '''{"content": str} or {"tool_call": {"name", "arguments"}}'''
+    messages = request.get("messages", [])
+    tools = request.get("tools") or []
+    tool_choice = request.get("tool_choice")
+    text = user_text(messages)
+    last_role = messages[-1].get("role") if messages else "user"
+    forced = isinstance(tool_choice, dict) or tool_choice == "required"
+    if tools and tool_choice != "none" and (forced or last_role != "tool"):
+        function = pick_tool(tools, tool_choice, text)
+        return {"tool_call": {"name": function["name"],
+                              "arguments": json.dumps(schema_arguments(function.get("parameters", {}), text))}}
+    words = min(STUB_RESPONSE_WORDS, request.get("max_tokens") or request.get("max_completion_tokens") or STUB_RESPONSE_WORDS)
+    return {"content": reply_text(text + str(len(messages)), words)}
+
+
+def usage(request: dict, reply: dict) -> dict:
+    prompt_tokens = sum(len(message_text(message)) // 4 + 1 for message in request.get("messages", []))
+    output = reply.get("content") or reply["tool_call"]["arguments"]
+    completion_tokens = len(output) // 4 + 1
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def create_app(latency: LatencyModel, token_ms: float = STUB_TOKEN_MS) -> FastAPI:
+    app = FastAPI()
+    embeddings = HashedNgramEmbeddings(dimensions=1536)
+    stats = {"chat_completions": 0, "streamed": 0, "tool_calls": 0, "embeddings": 0}
+
+    @app.get("/stats")
+    def get_stats():
+        return stats
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        reply = completion(body)
+        stats["chat_completions"] += 1
+        stats["tool_calls"] += "tool_call" in reply
+        completion_id = f"chatcmpl-stub-{stats['chat_completions']}"
+        model = body.get("model", "stub")
+        created = int(time.time())
+        await asyncio.sleep(latency.sample())
+
+        if "tool_call" in reply:
+            message = {"role": "assistant", "content": None, "tool_calls": [
+                {"id": f"call_{completion_id}", "type": "function", "function": reply["tool_call"]}]}
+            finish_reason = "tool_calls"
+        else:
+            message = {"role": "assistant", "content": reply["content"]}
+            finish_reason = "stop"
+
+        if not body.get("stream"):
+            return {"id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                    "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                    "usage": usage(body, reply)}
+
+        stats["streamed"] += 1
+
+        def chunk(delta: dict, finish=None, **extra) -> str:
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra}
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def stream():
+            yield chunk({"role": "assistant", "content": ""})
+            if "tool_call" in reply:
+                call = message["tool_calls"][0]
+                yield chunk({"tool_calls": [{"index": 0, **call}]})
+            else:
+                for index, word in enumerate(reply["content"].split(" ")):
+                    if index:
+                        await asyncio.sleep(token_ms / 1000)
+                    yield chunk({"content": word if index == 0 else f" {word}"})
+            yield chunk({}, finish_reason)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                data = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                        "model": model, "choices": [], "usage": usage(body, reply)}
+                yield f"data: {json.dumps(data)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def create_embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        # OpenAIEmbeddings may send token ids instead of text; they hash just as deterministically
+        texts = [" ".join(map(str, item)) if isinstance(item, list) else item for item in inputs]
+        vectors = embeddings.embed_documents(texts)
+        stats["embeddings"] += len(texts)
+        if body.get("encoding_format") == "base64":
+            vectors = [base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode("ascii")
+                       for vector in vectors]
+        tokens = sum(len(text) // 4 + 1 for text in texts)
+        return {"object": "list", "model": body.get("model", "stub"),
+                "data": [{"object": "embedding", "index": i, "embedding": vector} for i, vector in enumerate(vectors)],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deterministic OpenAI-compatible stand-in for load tests")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=STUB_LATENCY_MS, help="mean time to first token")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default=STUB_LATENCY_DIST)
+    parser.add_argument("--jitter", type=float, default=STUB_LATENCY_JITTER,
+                        help="uniform: +/- fraction of the mean; lognormal: sigma (default: 0.3)")
+    parser.add_argument("--token-ms", type=float, default=STUB_TOKEN_MS, help="delay between streamed tokens")
+    parser.add_argument("--seed", type=int, default=STUB_SEED)
+    args = parser.parse_args(argv)
+
+    latency = LatencyModel(args.latency_ms, args.latency_dist, args.jitter, args.seed)
+    uvicorn.run(create_app(latency, args.token_ms), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
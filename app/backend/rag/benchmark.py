@@ -0,0 +1,164 @@
+import json
+import time
+import argparse
+import tempfile
+import statistics
+from itertools import product
+from pathlib import Path
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import Chroma
+from app.backend.rag.corpora import CORPORA, CHUNK_SIZE, CHUNK_OVERLAP
+from app.backend.rag.embedding_providers import create_embeddings
+from app.backend.rag.fetcher import load_documents
+from app.backend.rag.lexical import BM25Index
+from app.backend.rag.retrieval import search_index, normalize_query
+
+# Retrieval benchmark: sweeps chunking, k and retriever type over each agent's corpus against
+# labelled queries, reporting recall@k, MRR, index size, build time and query latency.
+# Queries file: {"<agent>": [{"query": "...", "relevant": ["passage that answers it", ...]}, ...]}
+# A retrieved chunk is relevant if it contains one of the passages (case and whitespace
+# insensitive), so labels stay valid across chunk sizes; keep passages to a sentence or two.
+# Usage: python -m app.backend.rag.benchmark --queries queries.json [--chunk-sizes 500 1000]
+#        [--chunk-overlaps 100 200] [--ks 1 3 5] [--retrievers dense lexical hybrid] [--offline] [--json out.json]
+
+RETRIEVERS = ("dense", "lexical", "hybrid")
+
+
+def directory_size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def score_query(docs: list, relevant: list, ks: list) -> dict:
+    '''{k: (recall@k, reciprocal rank within the top k)} for one query'''
+    passages = [normalize_query(passage) for passage in relevant]
+    chunks = [normalize_query(doc.page_content) for doc in docs]
+    scores = {}
+    for k in ks:
+        top = chunks[:k]
+        found = sum(any(passage in chunk for chunk in top) for passage in passages)
+        first = next((rank for rank, chunk in enumerate(top, start=1)
+                      if any(passage in chunk for passage in passages)), None)
+        scores[k] = (found / len(passages) if passages else 0.0, 1 / first if first else 0.0)
+    return scores
+
+
+def build(name: str, documents: list, embedding, chunk_size: int, chunk_overlap: int, path: Path):
+    '''Splits and indexes one corpus into path; returns (vector store, BM25 index, chunks, seconds)'''
+    start = time.perf_counter()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    splits = splitter.split_documents(documents)
+    vectorstore = Chroma.from_documents(documents=splits, embedding=embedding,
+                                        collection_name=name, persist_directory=str(path))
+    lexical = BM25Index.from_vectorstore(vectorstore)
+    lexical.save(path)
+    return vectorstore, lexical, len(splits), time.perf_counter() - start
+
+
+def run(queries: dict, documents: dict, chunk_sizes: list, chunk_overlaps: list, ks: list,
+        retrievers: list, embedding) -> list:
+    results = []
+    max_k = max(ks)
+    for chunk_size, chunk_overlap in product(chunk_sizes, chunk_overlaps):
+        if chunk_overlap >= chunk_size:
+            continue
+        pooled = {(retriever, k): [] for retriever in retrievers for k in ks}
+        pooled_latency = {retriever: [] for retriever in retrievers}
+        totals = {"chunks": 0, "index_bytes": 0, "build_seconds": 0.0}
+        for name, labelled in queries.items():
+            with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmp:
+                vectorstore, lexical, chunks, build_seconds = build(
+                    name, documents[name], embedding, chunk_size, chunk_overlap, Path(tmp))
+                index_bytes = directory_size(Path(tmp))
+                totals["chunks"] += chunks
+                totals["index_bytes"] += index_bytes
+                totals["build_seconds"] += build_seconds
+                for retriever in retrievers:
+                    scores, latencies = [], []
+                    for item in labelled:
+                        # Rankings do not depend on k, so one search at the largest k scores every k
+                        start = time.perf_counter()
+                        docs = search_index(vectorstore, lexical, item["query"], max_k, mode=retriever)
+                        latencies.append((time.perf_counter() - start) * 1000)
+                        scores.append(score_query(docs, item["relevant"], ks))
+                    pooled_latency[retriever] += latencies
+                    for k in ks:
+                        pooled[(retriever, k)] += [score[k] for score in scores]
+                        results.append(result_row(name, chunk_size, chunk_overlap, retriever, k,
+                                                  [score[k] for score in scores], latencies,
+                                                  chunks, index_bytes, build_seconds))
+                vectorstore.delete_collection()
+        if len(queries) > 1:
+            for retriever, k in pooled:
+                results.append(result_row("ALL", chunk_size, chunk_overlap, retriever, k, pooled[(retriever, k)],
+                                          pooled_latency[retriever], totals["chunks"], totals["index_bytes"],
+                                          totals["build_seconds"]))
+    return results
+
+
+def result_row(agent, chunk_size, chunk_overlap, retriever, k, scores, latencies, chunks, index_bytes, build_seconds):
+    return {
+        "agent": agent,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "retriever": retriever,
+        "k": k,
+        "queries": len(scores),
+        "recall": statistics.mean(recall for recall, _ in scores) if scores else 0.0,
+        "mrr": statistics.mean(rr for _, rr in scores) if scores else 0.0,
+        "chunks": chunks,
+        "index_bytes": index_bytes,
+        "build_seconds": round(build_seconds, 3),
+        "latency_ms_mean": statistics.mean(latencies) if latencies else 0.0,
+        "latency_ms_p95": sorted(latencies)[max(0, round(0.95 * len(latencies)) - 1)] if latencies else 0.0,
+    }
+
+
+def print_table(results: list):
+    print(f"{'agent':<26}{'size':>6}{'ovl':>5}{'retriever':>10}{'k':>3}{'recall':>8}{'mrr':>7}"
+          f"{'chunks':>8}{'index KB':>10}{'build s':>9}{'ms/query':>10}")
+    for row in results:
+        print(f"{row['agent']:<26}{row['chunk_size']:>6}{row['chunk_overlap']:>5}{row['retriever']:>10}{row['k']:>3}"
+              f"{row['recall']:>8.3f}{row['mrr']:>7.3f}{row['chunks']:>8}{row['index_bytes'] / 1024:>10.0f}"
+              f"{row['build_seconds']:>9.2f}{row['latency_ms_mean']:>10.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency over the agent corpora")
+    parser.add_argument("--queries", required=True, help="labelled queries per agent (JSON)")
+    parser.add_argument("--agents", nargs="+", choices=sorted(CORPORA), help="agents to benchmark (default: all labelled)")
+    parser.add_argument("--chunk-sizes", nargs="+", type=int, default=[CHUNK_SIZE])
+    parser.add_argument("--chunk-overlaps", nargs="+", type=int, default=[CHUNK_OVERLAP])
+    parser.add_argument("--ks", nargs="+", type=int, default=[1, 3, 5])
+    parser.add_argument("--retrievers", nargs="+", choices=RETRIEVERS, default=list(RETRIEVERS))
+    parser.add_argument("--offline", action="store_true", help="use the local snapshots only")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+    unknown = sorted(set(queries) - set(CORPORA))
+    if unknown:
+        parser.error(f"no corpus for {unknown}; choose from {sorted(CORPORA)}")
+    if args.agents:
+        queries = {name: labelled for name, labelled in queries.items() if name in args.agents}
+    for name, labelled in queries.items():
+        for item in labelled:
+            if any(len(passage) > min(args.chunk_sizes) for passage in item["relevant"]):
+                print(f"Warning: a passage for {name} query '{item['query']}' is longer than the smallest chunk "
+                      f"and can never be matched at that size")
+
+    documents = {name: load_documents(CORPORA[name], offline=args.offline) for name in queries}
+
+    # Uncached, so build times don't depend on how warm the persistent embedding cache happens to be
+    embedding = create_embeddings()
+    print(f"Embedding with {getattr(embedding, 'model', type(embedding).__name__)} (embedding cache off); "
+          f"{sum(len(labelled) for labelled in queries.values())} queries over {len(queries)} corpora\n")
+    results = run(queries, documents, args.chunk_sizes, args.chunk_overlaps, args.ks, args.retrievers, embedding)
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": dict(vars(args), embedding_cache="off"), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
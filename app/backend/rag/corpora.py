@@ -0,0 +1,28 @@
+## CORPORA ##
+
+# Web paths for the documents each RAG agent retrieves from (kept in sync with documents/docs.txt)
+CORPORA = {
+    "initial_stress_agent": ["https://pmc.ncbi.nlm.nih.gov/articles/PMC10741869/",
+                             "https://www.healthline.com/health/grounding-techniques#physical-techniques",
+                             "https://www.resiliencelab.us/thought-lab/grounding-techniques",
+                             "https://www.ncbi.nlm.nih.gov/books/NBK207188/box/part1_ch4.box5/?report=objectonly"],
+    "decision_maker_agent": ["https://asana.com/resources/eisenhower-matrix",
+                             "https://www.indeed.com/career-advice/career-development/how-to-overcome-indecisiveness",
+                             "https://www.usebubbles.com/blog/averting-indecision-techniques-for-streamlining-your-decision-making-process?utm_medium=organic&utm_source=www.perplexity.ai&utm_content=blog%252Faverting-indecision-techniques-for-streamlining-your-decision-making-process",
+                             "https://www.npr.org/2022/03/07/1084907897/any-decision-is-better-than-indecision-try-these-tips-to-actually-choose",
+                             "https://pmc.ncbi.nlm.nih.gov/articles/PMC5459222/",
+                             "https://5amjoel.com/weighted-decision-matrix/"],
+    "indecision_analyst_agent": ["https://pmc.ncbi.nlm.nih.gov/articles/PMC8481952/",
+                                 "https://pmc.ncbi.nlm.nih.gov/articles/PMC10658848/",
+                                 "https://www.mentallyfitpro.com/c/free-therapy-worksheets/cognitive-distortions-identifying-and-challenging-unhelpful-thinking-patterns",
+                                 "https://www.headspace.com/articles/brain-indecision",
+                                 "https://www.psychologytoday.com/us/tests/personality/perfectionism-test",
+                                 "https://online.hbs.edu/blog/post/root-cause-analysis"],
+    "lifestyle_coach_agent": ["https://www.psychologytoday.com/us/blog/the-mindful-path-to-self-acceptance/202103/how-to-break-free-from-the-prison-of-indecisiveness",
+                              "https://growtherapy.com/blog/mindfulness-exercises-to-reduce-stress-and-anxiety/",
+                              "https://www.healthline.com/nutrition/16-ways-relieve-stress-anxiety"],
+}
+
+# Split settings used when building every collection
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
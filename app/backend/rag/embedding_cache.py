@@ -0,0 +1,170 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from typing import List
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from app.backend.rag.index_store import ROOT_DIR
+from app.backend.rag.embedding_providers import create_embeddings, EMBEDDING_PROVIDER
+from app.backend.tracing import tracer
+
+# Load environment variables
+load_dotenv()
+
+# Shared, content-addressed embedding cache backed by SQLite
+CACHE_PATH = os.getenv("LULU_EMBEDDING_CACHE", str(ROOT_DIR / "indexes" / "embeddings.sqlite"))
+CACHE_MAX_ENTRIES = int(os.getenv("LULU_EMBEDDING_CACHE_MAX_ENTRIES", 200_000))
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    '''Size-bounded LRU store of embedding vectors keyed by (model, normalized text hash)'''
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        # Upper bound on the row count, so puts don't need a COUNT(*); re-synced whenever eviction runs
+        (self.entries,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def get_many(self, keys: List[str]) -> dict:
+        if not keys:
+            return {}
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self.conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                      [(now, key) for key in found])
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, model: str, items: dict):
+        if not items:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(key, model, array("f", vector).tobytes(), now) for key, vector in items.items()],
+            )
+            self.entries += len(items)
+            if self.entries > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        # Evict down to 90% of the bound so the next count and eviction is thousands of inserts away
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - int(self.max_entries * 0.9) if count > self.max_entries else 0
+        self.entries = count - overflow
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+
+    def stats(self) -> dict:
+        with self.lock:
+            (entries,) = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    '''Embeddings wrapper that only sends cache misses to the underlying model'''
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model: str = None):
+        self.underlying = underlying
+        self.cache = cache
+        self.model = model or getattr(underlying, "model", type(underlying).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model, text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Embed each missing text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model, fresh)
+            cached.update(fresh)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        with tracer.span("retrieval", "embed_query") as attributes:
+            key = cache_key(self.model, text)
+            cached = self.cache.get_many([key])
+            attributes["cached"] = key in cached
+            if key in cached:
+                return cached[key]
+            vector = self.underlying.embed_query(text)
+            self.cache.put_many(self.model, {key: vector})
+            return vector
+
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings() -> Embeddings:
+    '''Returns the process-wide embedding model shared by every agent, from EMBEDDING_PROVIDER.
+    Remote providers are wrapped in the embedding cache; the local one is cheaper to recompute.'''
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            underlying = create_embeddings()
+            if EMBEDDING_PROVIDER == "local":
+                _embeddings = underlying
+            else:
+                _embeddings = CachedEmbeddings(underlying, EmbeddingCache())
+                logging.info(f"Embedding cache opened at {CACHE_PATH}")
+        return _embeddings
@@ -0,0 +1,88 @@
+import os
+import re
+import hashlib
+from functools import lru_cache
+from typing import List
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+# Load environment variables
+load_dotenv()
+# "openai" calls the OpenAI embeddings API; "local" computes hashed n-gram vectors offline
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")
+LOCAL_EMBEDDING_DIMENSIONS = int(os.getenv("LOCAL_EMBEDDING_DIMENSIONS", 1024))
+# Memoized n-gram hashes, bounded since every distinct query adds new features
+LOCAL_EMBEDDING_HASH_CACHE_SIZE = int(os.getenv("LOCAL_EMBEDDING_HASH_CACHE_SIZE", 200_000))
+
+
+@lru_cache(maxsize=LOCAL_EMBEDDING_HASH_CACHE_SIZE)
+def hashed_bucket(feature: str, dimensions: int):
+    '''(bucket, sign) of one feature, memoized since hashing dominates embedding time'''
+    digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return digest % dimensions, 1.0 if digest >> 63 else -1.0
+
+
+class HashedNgramEmbeddings(Embeddings):
+    '''Deterministic offline embeddings: word unigrams, word bigrams and character trigrams hashed
+    into a fixed number of signed buckets with sublinear term frequency, then L2-normalized.
+
+    No network, no API key and no fitted state, so the same text always gets the same vector and
+    the whole corpus embeds in milliseconds. Meant for CI, benchmarks and load tests, not for
+    answer quality.
+    '''
+
+    def __init__(self, dimensions: int = LOCAL_EMBEDDING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.model = f"local-hashed-ngrams-{dimensions}"
+
+    def bucket(self, feature: str):
+        return hashed_bucket(feature, self.dimensions)
+
+    @staticmethod
+    def features(text: str) -> list:
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        grams = [f"w:{word}" for word in words]
+        grams += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        return grams
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        rows, columns, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                column, sign = self.bucket(feature)
+                rows.append(row)
+                columns.append(column)
+                signs.append(sign)
+        counts = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(counts, (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp)),
+                  np.asarray(signs, dtype=np.float32))
+        # Sublinear term frequency keeps repeated words from dominating
+        vectors = np.sign(counts) * np.log1p(np.abs(counts))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def openai_embeddings() -> Embeddings:
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings()
+
+
+# Provider name -> factory
+EMBEDDING_PROVIDERS = {
+    "openai": openai_embeddings,
+    "local": HashedNgramEmbeddings,
+}
+
+
+def create_embeddings(provider: str = EMBEDDING_PROVIDER) -> Embeddings:
+    if provider not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER '{provider}'; choose one of {sorted(EMBEDDING_PROVIDERS)}")
+    return EMBEDDING_PROVIDERS[provider]()
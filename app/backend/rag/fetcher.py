@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+from dataclasses import dataclass
+from pathlib import Path
+import aiohttp
+from bs4 import BeautifulSoup
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from app.backend.rag.corpora import CORPORA
+from app.backend.rag.index_store import ROOT_DIR
+
+# Load environment variables
+load_dotenv()
+
+# Raw HTML snapshots (plus ETag/Last-Modified) live in <SNAPSHOT_DIR>/<sha256(url)>.html/.json
+SNAPSHOT_DIR = Path(os.getenv("LULU_SNAPSHOT_DIR", ROOT_DIR / "snapshots"))
+DOCS_LIST = ROOT_DIR / "documents" / "docs.txt"
+MAX_CONNECTIONS = int(os.getenv("LULU_FETCH_MAX_CONNECTIONS", 16))
+MAX_PER_HOST = int(os.getenv("LULU_FETCH_MAX_PER_HOST", 2))
+TIMEOUT_SECONDS = float(os.getenv("LULU_FETCH_TIMEOUT", 30))
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+}
+
+
+class SnapshotMissingError(FileNotFoundError):
+    pass
+
+
+@dataclass
+class Snapshot:
+    url: str
+    html: str
+    etag: str = None
+    last_modified: str = None
+    fetched_at: float = None
+    status: str = "cached"  # "fetched", "not_modified", "cached" or "stale"
+
+
+def snapshot_paths(url: str):
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return SNAPSHOT_DIR / f"{digest}.html", SNAPSHOT_DIR / f"{digest}.json"
+
+
+def read_snapshot(url: str):
+    html_path, meta_path = snapshot_paths(url)
+    if not (html_path.exists() and meta_path.exists()):
+        return None
+    meta = json.loads(meta_path.read_text())
+    return Snapshot(url=url,
+                    html=html_path.read_text(encoding="utf-8"),
+                    etag=meta.get("etag"),
+                    last_modified=meta.get("last_modified"),
+                    fetched_at=meta.get("fetched_at"))
+
+
+def write_snapshot(snapshot: Snapshot, write_html: bool = True):
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    html_path, meta_path = snapshot_paths(snapshot.url)
+    if write_html:
+        tmp = html_path.with_suffix(".html.tmp")
+        tmp.write_text(snapshot.html, encoding="utf-8")
+        os.replace(tmp, html_path)
+    meta = {"url": snapshot.url,
+            "etag": snapshot.etag,
+            "last_modified": snapshot.last_modified,
+            "fetched_at": snapshot.fetched_at}
+    tmp = meta_path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(meta, indent=2))
+    os.replace(tmp, meta_path)
+
+
+def parse_docs_list(path: Path = DOCS_LIST) -> dict:
+    '''Reads the heading -> URLs lists kept in documents/docs.txt'''
+    sources, heading = {}, None
+    if not path.exists():
+        return sources
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if line.endswith(":") and not line.startswith("http"):
+            heading = line[:-1]
+            sources[heading] = []
+        elif line.startswith("http") and heading:
+            sources[heading].append(line)
+    return sources
+
+
+def all_source_urls() -> list:
+    urls = [url.strip() for agent_urls in CORPORA.values() for url in agent_urls]
+    urls += [url for listed in parse_docs_list().values() for url in listed]
+    return list(dict.fromkeys(urls))
+
+
+async def fetch_one(session: aiohttp.ClientSession, url: str) -> Snapshot:
+    cached = read_snapshot(url)
+    headers = {}
+    if cached and cached.etag:
+        headers["If-None-Match"] = cached.etag
+    if cached and cached.last_modified:
+        headers["If-Modified-Since"] = cached.last_modified
+
+    try:
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304 and cached:
+                cached.fetched_at = time.time()
+                cached.status = "not_modified"
+                write_snapshot(cached, write_html=False)
+                return cached
+            response.raise_for_status()
+            snapshot = Snapshot(url=url,
+                                html=await response.text(errors="replace"),
+                                etag=response.headers.get("ETag"),
+                                last_modified=response.headers.get("Last-Modified"),
+                                fetched_at=time.time(),
+                                status="fetched")
+            write_snapshot(snapshot)
+            return snapshot
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        if cached:
+            logging.warning(f"Fetching {url} failed ({e!r}); using snapshot from {cached.fetched_at}")
+            cached.status = "stale"
+            return cached
+        raise
+
+
+async def fetch_all(urls, offline: bool = False) -> dict:
+    '''Fetches urls concurrently, revalidating snapshots; offline mode reads snapshots only'''
+    urls = list(dict.fromkeys(url.strip() for url in urls))
+    if offline:
+        snapshots = {url: read_snapshot(url) for url in urls}
+        missing = [url for url, snapshot in snapshots.items() if snapshot is None]
+        if missing:
+            raise SnapshotMissingError(f"No snapshot for {len(missing)} url(s) in offline mode: {missing}")
+        return snapshots
+
+    connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS, limit_per_host=MAX_PER_HOST)
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT_SECONDS)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=HEADERS) as session:
+        results = await asyncio.gather(*(fetch_one(session, url) for url in urls),
+                                       return_exceptions=True)
+
+    snapshots = {}
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            logging.error(f"Failed to fetch {url}: {result!r}")
+        else:
+            snapshots[url] = result
+    return snapshots
+
+
+def to_document(snapshot: Snapshot) -> Document:
+    '''Parses a snapshot the same way WebBaseLoader does'''
+    soup = BeautifulSoup(snapshot.html, "html.parser")
+    metadata = {"source": snapshot.url}
+    if title := soup.find("title"):
+        metadata["title"] = title.get_text()
+    if description := soup.find("meta", attrs={"name": "description"}):
+        metadata["description"] = description.get("content", "No description found.")
+    if html := soup.find("html"):
+        metadata["language"] = html.get("lang", "No language found.")
+    return Document(page_content=soup.get_text(), metadata=metadata)
+
+
+def load_documents(urls, offline: bool = False) -> list:
+    snapshots = asyncio.run(fetch_all(urls, offline=offline))
+    return [to_document(snapshots[url.strip()]) for url in urls if url.strip() in snapshots]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch and snapshot every source document")
+    parser.add_argument("--offline", action="store_true", help="only check that snapshots exist")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    urls = all_source_urls()
+    start = time.perf_counter()
+    snapshots = asyncio.run(fetch_all(urls, offline=args.offline))
+    counts = {}
+    for snapshot in snapshots.values():
+        counts[snapshot.status] = counts.get(snapshot.status, 0) + 1
+    failed = len(urls) - len(snapshots)
+    print(f"{len(snapshots)}/{len(urls)} urls in {time.perf_counter() - start:.1f}s "
+          f"{counts} failed={failed} -> {SNAPSHOT_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import os
+import json
+import shutil
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from dotenv import load_dotenv
+from langchain_community.vectorstores import Chroma
+from app.backend.rag.lexical import BM25Index
+
+# Load environment variables
+load_dotenv()
+
+# Indexes live in <INDEX_DIR>/<collection>/v<N>/ with a CURRENT file naming the live version
+ROOT_DIR = Path(__file__).resolve().parents[3]
+INDEX_DIR = Path(os.getenv("LULU_INDEX_DIR", ROOT_DIR / "indexes"))
+KEEP_VERSIONS = int(os.getenv("LULU_INDEX_KEEP_VERSIONS", 2))
+
+
+class IndexNotBuiltError(FileNotFoundError):
+    pass
+
+
+def collection_dir(name: str) -> Path:
+    return INDEX_DIR / name
+
+
+def current_version(name: str):
+    '''Returns the live version of a collection, or None if it was never built'''
+    pointer = collection_dir(name) / "CURRENT"
+    if not pointer.exists():
+        return None
+    return pointer.read_text().strip()
+
+
+def version_dir(name: str, version: str = None) -> Path:
+    version = version or current_version(name)
+    if version is None:
+        raise IndexNotBuiltError(
+            f"No index built for '{name}'. Run `python -m app.backend.rag.ingest` first."
+        )
+    return collection_dir(name) / version
+
+
+def read_manifest(name: str, version: str = None) -> dict:
+    path = version_dir(name, version) / "manifest.json"
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def next_version(name: str) -> str:
+    existing = [int(p.name[1:]) for p in collection_dir(name).glob("v*") if p.name[1:].isdigit()]
+    return f"v{max(existing, default=0) + 1}"
+
+
+def build_index(name: str, splits, embedding, manifest: dict, ids=None) -> str:
+    '''Embeds the splits into a fresh version directory and makes it the live version'''
+    version = next_version(name)
+    path = collection_dir(name) / version
+    path.mkdir(parents=True, exist_ok=True)
+
+    vectorstore = Chroma.from_documents(documents=splits,
+                                        embedding=embedding,
+                                        ids=ids,
+                                        collection_name=name,
+                                        persist_directory=str(path))
+    BM25Index.from_vectorstore(vectorstore).save(path)
+
+    write_manifest(path, name, version, len(splits), manifest)
+    publish_version(name, version)
+    return version
+
+
+def update_index(name: str, embedding, manifest: dict, add_splits, add_ids, remove_ids, chunks: int) -> str:
+    '''Copies the live version, applies the chunk delta to the copy and makes it the live version'''
+    base = version_dir(name)
+    version = next_version(name)
+    path = collection_dir(name) / version
+    shutil.copytree(base, path)
+
+    vectorstore = Chroma(collection_name=name,
+                         embedding_function=embedding,
+                         persist_directory=str(path))
+    if remove_ids:
+        vectorstore.delete(ids=list(remove_ids))
+    if add_splits:
+        vectorstore.add_documents(add_splits, ids=list(add_ids))
+    # The lexical index is cheap to rebuild from the updated collection
+    BM25Index.from_vectorstore(vectorstore).save(path)
+
+    write_manifest(path, name, version, chunks, manifest)
+    publish_version(name, version)
+    return version
+
+
+def write_manifest(path: Path, name: str, version: str, chunks: int, manifest: dict):
+    manifest = dict(manifest,
+                    collection=name,
+                    version=version,
+                    chunks=chunks,
+                    built_at=datetime.now(timezone.utc).isoformat())
+    (path / "manifest.json").write_text(json.dumps(manifest, indent=2))
+
+
+def publish_version(name: str, version: str):
+    '''Atomically points CURRENT at a version and prunes old ones'''
+    pointer = collection_dir(name) / "CURRENT"
+    tmp = pointer.with_suffix(".tmp")
+    tmp.write_text(version)
+    os.replace(tmp, pointer)
+    logging.info(f"Index {name} now serving {version}")
+    prune_versions(name)
+
+
+def prune_versions(name: str):
+    versions = sorted((p for p in collection_dir(name).glob("v*") if p.name[1:].isdigit()),
+                      key=lambda p: int(p.name[1:]))
+    live = current_version(name)
+    for path in versions[:-KEEP_VERSIONS]:
+        if path.name != live:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_vectorstore(name: str, embedding) -> Chroma:
+    '''Opens the live version of a collection built by the ingest command'''
+    path = version_dir(name)
+    if not path.exists():
+        raise IndexNotBuiltError(f"Index directory {path} is missing for '{name}'.")
+    return Chroma(collection_name=name,
+                  embedding_function=embedding,
+                  persist_directory=str(path))
+
+
+def load_lexical_index(name: str):
+    '''Opens the BM25 index of the live version, or None if that version predates lexical indexes'''
+    return BM25Index.load(version_dir(name))
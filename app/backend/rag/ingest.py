@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import time
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from app.backend.rag.corpora import CORPORA, CHUNK_SIZE, CHUNK_OVERLAP
+from app.backend.rag.index_store import build_index, update_index, read_manifest, current_version, INDEX_DIR
+from app.backend.rag.embedding_cache import get_embeddings
+from app.backend.rag.fetcher import fetch_all, to_document
+
+# Offline ingestion: fetch, split and embed each agent's corpus into a versioned index.
+# Re-runs diff against the live manifest and only embed new or changed chunks.
+# Usage: python -m app.backend.rag.ingest [--agents initial_stress_agent ...] [--offline] [--full]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source: str, text: str) -> str:
+    return content_hash(f"{source}\x00{text}")
+
+
+def ingest(name: str, urls, snapshots: dict, embedding, full: bool = False):
+    '''Builds or refreshes one collection, embedding only chunks that are not already indexed'''
+    start = time.perf_counter()
+    settings = {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embedding_model": getattr(embedding, "model", type(embedding).__name__),
+    }
+    previous = read_manifest(name) if current_version(name) else {}
+    previous_docs = previous.get("documents", {})
+    # A settings change invalidates every chunk id, so fall back to a full build
+    incremental = bool(previous_docs) and not full and all(previous.get(k) == v for k, v in settings.items())
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    documents, new_splits = {}, {}
+    for url in urls:
+        if url not in snapshots:
+            # Keep what we already had for sources that could not be fetched this run. A full build
+            # starts from an empty collection, so those chunks would be missing; leave the source out
+            # of the manifest so the next run embeds it
+            if incremental and url in previous_docs:
+                documents[url] = previous_docs[url]
+            else:
+                logging.warning(f"{name}: no snapshot of {url}; it is left out of this build")
+            continue
+        doc = to_document(snapshots[url])
+        digest = content_hash(doc.page_content)
+        if incremental and previous_docs.get(url, {}).get("content_hash") == digest:
+            documents[url] = previous_docs[url]
+            continue
+
+        # Split
+        ids = []
+        for split in text_splitter.split_documents([doc]):
+            split_id = chunk_id(url, split.page_content)
+            if split_id not in new_splits:
+                new_splits[split_id] = split
+                ids.append(split_id)
+        documents[url] = {"content_hash": digest, "chunk_ids": ids}
+
+    manifest = dict(settings, sources=urls, documents=documents)
+    live_ids = {i for entry in documents.values() for i in entry["chunk_ids"]}
+
+    # Embed
+    if incremental:
+        old_ids = {i for entry in previous_docs.values() for i in entry["chunk_ids"]}
+        added = [i for i in new_splits if i not in old_ids]
+        removed = old_ids - live_ids
+        unchanged = len(live_ids) - len(added)
+        if not added and not removed:
+            print(f"{name}: up to date ({unchanged} unchanged chunks)")
+            return
+        version = update_index(name, embedding, manifest,
+                               add_splits=[new_splits[i] for i in added],
+                               add_ids=added,
+                               remove_ids=removed,
+                               chunks=len(live_ids))
+    else:
+        added, removed, unchanged = list(new_splits), set(), 0
+        version = build_index(name, list(new_splits.values()), embedding, manifest, ids=added)
+    print(f"{name}: +{len(added)} added, -{len(removed)} removed, {unchanged} unchanged -> {version} "
+          f"({time.perf_counter() - start:.1f}s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the agents' vector indexes")
+    parser.add_argument("--agents", nargs="+", choices=sorted(CORPORA), default=sorted(CORPORA),
+                        help="collections to build (default: all)")
+    parser.add_argument("--offline", action="store_true",
+                        help="build from local snapshots only, without any network access")
+    parser.add_argument("--full", action="store_true",
+                        help="rebuild every collection from scratch instead of applying the delta")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    print(f"Writing indexes to {INDEX_DIR}")
+    # Fetch every collection's sources in one concurrent pass
+    sources = {name: [url.strip() for url in CORPORA[name]] for name in args.agents}
+    snapshots = asyncio.run(fetch_all([url for urls in sources.values() for url in urls],
+                                      offline=args.offline))
+
+    embedding = get_embeddings()
+    print(f"Embedding with {getattr(embedding, 'model', type(embedding).__name__)}")
+    for name, urls in sources.items():
+        ingest(name, urls, snapshots, embedding, full=args.full)
+    if hasattr(embedding, "cache"):
+        print(f"Embedding cache: {embedding.cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
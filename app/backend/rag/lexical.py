@@ -0,0 +1,95 @@
+import re
+import json
+import math
+import logging
+from collections import Counter
+from pathlib import Path
+from langchain_core.documents import Document
+
+# BM25 inverted index stored next to each vector index version, so exact technique names
+# ("4-7-8 breathing", "Eisenhower matrix") are found even when the embedding misses them
+LEXICAL_INDEX_FILE = "bm25.json"
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "for", "from", "how", "i", "if",
+    "in", "is", "it", "me", "my", "of", "on", "or", "so", "that", "the", "their", "this", "to", "was",
+    "what", "when", "which", "with", "you", "your",
+}
+
+
+def tokenize(text: str) -> list:
+    '''Lowercased terms; hyphenated compounds like "4-7-8" are kept whole and also split into parts'''
+    terms = []
+    for token in re.findall(r"[a-z0-9]+(?:[-'][a-z0-9]+)*", text.lower()):
+        token = token.replace("'", "")
+        parts = token.split("-")
+        if len(parts) > 1:
+            terms.append(token)
+        terms.extend(part for part in parts if part not in STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    '''Okapi BM25 over a collection's chunks'''
+
+    def __init__(self, ids: list, texts: list, metadatas: list, k1: float = 1.5, b: float = 0.75):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> [(doc index, term frequency)]
+        self.lengths = []
+        for index, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((index, tf))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.ids) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int = 4) -> list:
+        '''[(Document, score)] best first'''
+        scores = Counter()
+        for term in set(tokenize(query)):
+            idf = self.idf(term)
+            for index, tf in self.postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / (self.avg_length or 1.0))
+                scores[index] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return [(Document(page_content=self.texts[index], metadata=self.metadatas[index]), score)
+                for index, score in scores.most_common(k)]
+
+    def save(self, path: Path):
+        data = {"k1": self.k1, "b": self.b, "ids": self.ids, "texts": self.texts, "metadatas": self.metadatas}
+        (path / LEXICAL_INDEX_FILE).write_text(json.dumps(data))
+
+    @classmethod
+    def load(cls, path: Path):
+        '''The index saved in a version directory, or None for versions built before it existed'''
+        file = path / LEXICAL_INDEX_FILE
+        if not file.exists():
+            logging.warning(f"No lexical index in {path}; re-run the ingest command to build one")
+            return None
+        data = json.loads(file.read_text())
+        return cls(data["ids"], data["texts"], data["metadatas"], k1=data["k1"], b=data["b"])
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        '''Indexes every chunk currently in a Chroma collection'''
+        stored = vectorstore.get(include=["documents", "metadatas"])
+        return cls(stored["ids"], stored["documents"], [metadata or {} for metadata in stored["metadatas"]])
+
+
+def reciprocal_rank_fusion(rankings: list, k: int, constant: int = 60) -> list:
+    '''Merges ranked Document lists by summed 1 / (constant + rank); chunks match on source and text'''
+    scores = Counter()
+    documents = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = (doc.metadata.get("source"), doc.page_content)
+            scores[key] += 1 / (constant + rank)
+            documents.setdefault(key, doc)
+    return [documents[key] for key, _ in scores.most_common(k)]
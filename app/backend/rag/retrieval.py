@@ -0,0 +1,137 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from app.backend.rag.index_store import load_vectorstore, load_lexical_index, current_version
+from app.backend.rag.lexical import reciprocal_rank_fusion
+from app.backend.rag.embedding_cache import get_embeddings
+from app.backend.tracing import tracer
+
+# Load environment variables
+load_dotenv()
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", 2000))
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", 60 * 60))
+RETRIEVAL_DEFAULT_K = int(os.getenv("RETRIEVAL_DEFAULT_K", 4))
+# "hybrid" fuses dense and BM25 rankings; "dense" or "lexical" use one of them
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each ranking before fusion
+RETRIEVAL_FETCH_K = int(os.getenv("RETRIEVAL_FETCH_K", 10))
+# How often to check whether the ingest command published a new index version
+INDEX_VERSION_CHECK_SECONDS = float(os.getenv("INDEX_VERSION_CHECK_SECONDS", 5))
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def search_index(vectorstore, lexical, query: str, k: int, mode: str = RETRIEVAL_MODE, fetch_k: int = RETRIEVAL_FETCH_K):
+    '''Top-k chunks from one collection's vector store and BM25 index (None falls back to dense)'''
+    if mode == "dense" or lexical is None:
+        with tracer.span("retrieval", "dense"):
+            return vectorstore.similarity_search(query, k=k)
+    if mode == "lexical":
+        with tracer.span("retrieval", "lexical"):
+            return [doc for doc, _ in lexical.search(query, k=k)]
+    fetch_k = max(k, fetch_k)
+    with tracer.span("retrieval", "dense"):
+        dense = vectorstore.similarity_search(query, k=fetch_k)
+    with tracer.span("retrieval", "lexical"):
+        sparse = [doc for doc, _ in lexical.search(query, k=fetch_k)]
+    return reciprocal_rank_fusion([dense, sparse], k=k)
+
+
+class RetrievalService:
+    '''Shared retrieval for every agent's retrieve tool.
+
+    Results are memoized per (collection, index version, mode, normalized query, k) in an LRU with a
+    TTL, so a new index version naturally misses the old entries. Hybrid mode merges the vector and
+    BM25 rankings with reciprocal rank fusion.
+    '''
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_MAX_ENTRIES, ttl_seconds: float = RETRIEVAL_CACHE_TTL_SECONDS,
+                 mode: str = RETRIEVAL_MODE, fetch_k: int = RETRIEVAL_FETCH_K):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.mode = mode
+        self.fetch_k = fetch_k
+        self.collections = {}  # name -> {"version", "vectorstore", "lexical", "checked_at"}
+        self.cache = OrderedDict()
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def open(self, name: str):
+        '''Opens (or re-opens, after a new version is published) a collection's vector store'''
+        now = time.monotonic()
+        collection = self.collections.get(name)
+        if collection and now - collection["checked_at"] < INDEX_VERSION_CHECK_SECONDS:
+            return collection
+        version = current_version(name)
+        with self.lock:
+            collection = self.collections.get(name)
+            if collection and collection["version"] == version:
+                collection["checked_at"] = now
+                return collection
+            collection = {"version": version,
+                          "vectorstore": load_vectorstore(name, get_embeddings()),
+                          "lexical": load_lexical_index(name),
+                          "checked_at": now}
+            self.collections[name] = collection
+            # Drop results from the previous version
+            for key in [key for key in self.cache if key[0] == name and key[1] != version]:
+                del self.cache[key]
+        return collection
+
+    def search(self, name: str, query: str, k: int = RETRIEVAL_DEFAULT_K, mode: str = None):
+        '''Uncached retrieval with the given (or configured) mode'''
+        collection = self.open(name)
+        return search_index(collection["vectorstore"], collection["lexical"], query, k,
+                            mode=mode or self.mode, fetch_k=self.fetch_k)
+
+    def retrieve(self, name: str, query: str, k: int = RETRIEVAL_DEFAULT_K, mode: str = None):
+        with tracer.span("retrieval", name) as attributes:
+            docs, attributes["cached"] = self._retrieve(name, query, k, mode or self.mode)
+        return docs
+
+    def _retrieve(self, name: str, query: str, k: int, mode: str):
+        '''(docs, whether they came from the cache)'''
+        collection = self.open(name)
+        key = (name, collection["version"], mode, normalize_query(query), k)
+        metrics = self.metrics.setdefault(name, {"hits": 0, "misses": 0, "search_seconds": 0.0})
+
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry and time.monotonic() - entry[1] < self.ttl_seconds:
+                self.cache.move_to_end(key)
+                metrics["hits"] += 1
+                return entry[0], True
+
+        start = time.perf_counter()
+        docs = self.search(name, query, k=k, mode=mode)
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            metrics["misses"] += 1
+            metrics["search_seconds"] += elapsed
+            self.cache[key] = (docs, time.monotonic())
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return docs, False
+
+    def stats(self) -> dict:
+        stats = {}
+        for name, metrics in self.metrics.items():
+            lookups = metrics["hits"] + metrics["misses"]
+            stats[name] = {
+                "version": self.collections.get(name, {}).get("version"),
+                "hits": metrics["hits"],
+                "misses": metrics["misses"],
+                "hit_rate": metrics["hits"] / lookups if lookups else 0.0,
+                "avg_search_seconds": metrics["search_seconds"] / metrics["misses"] if metrics["misses"] else 0.0,
+            }
+        return {"mode": self.mode, "entries": len(self.cache), "collections": stats}
+
+
+retrieval_service = RetrievalService()
@@ -0,0 +1,154 @@
+import os
+import time
+import asyncio
+import logging
+from pathlib import Path
+import aiosqlite
+from dotenv import load_dotenv
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from app.backend.tracing import tracer
+
+# Load environment variables
+load_dotenv()
+ROOT_DIR = Path(__file__).resolve().parents[3]
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", str(ROOT_DIR / "data" / "checkpoints.sqlite"))
+CHECKPOINT_TTL_SECONDS = float(os.getenv("CHECKPOINT_TTL_SECONDS", 24 * 60 * 60))
+CHECKPOINT_MAX_PER_THREAD = int(os.getenv("CHECKPOINT_MAX_PER_THREAD", 10))
+CHECKPOINT_COMPACT_INTERVAL_SECONDS = float(os.getenv("CHECKPOINT_COMPACT_INTERVAL_SECONDS", 10 * 60))
+
+
+class CompactingSqliteSaver(AsyncSqliteSaver):
+    '''SQLite checkpointer for the supervisor's conversation threads, shared by every worker on the host.
+
+    Records when each thread was last written so compact() can drop threads idle for longer than
+    ttl_seconds, keep only the newest max_per_thread checkpoints of each live thread, and drop the
+    checkpoints of finished subgraph (worker agent) runs.
+    '''
+
+    def __init__(self, conn, ttl_seconds: float = CHECKPOINT_TTL_SECONDS,
+                 max_per_thread: int = CHECKPOINT_MAX_PER_THREAD):
+        super().__init__(conn)
+        self.ttl_seconds = ttl_seconds
+        self.max_per_thread = max_per_thread
+        self.activity_ready = False
+        self.compactions = 0
+        self.last_compaction = {}
+
+    async def setup(self):
+        await super().setup()
+        if self.activity_ready:
+            return
+        async with self.lock:
+            await self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)")
+            await self.conn.commit()
+        self.activity_ready = True
+
+    async def aget_tuple(self, config):
+        with tracer.span("db", "checkpoint.get"):
+            return await super().aget_tuple(config)
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        with tracer.span("db", "checkpoint.put"):
+            next_config = await super().aput(config, checkpoint, metadata, new_versions)
+            async with self.lock:
+                await self.conn.execute(
+                    "INSERT INTO thread_activity (thread_id, updated_at) VALUES (?, ?) "
+                    "ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at",
+                    (str(config["configurable"]["thread_id"]), time.time()))
+                await self.conn.commit()
+        return next_config
+
+    async def forget_thread(self, thread_id: str):
+        '''Drops every checkpoint of a thread that will not be used again'''
+        await self.setup()
+        async with self.lock:
+            for table in ("writes", "checkpoints", "thread_activity"):
+                await self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            await self.conn.commit()
+
+    async def compact(self) -> dict:
+        await self.setup()
+        now = time.time()
+        async with self.lock:
+            # Threads written before thread activity was tracked count as active now
+            await self.conn.execute(
+                "INSERT OR IGNORE INTO thread_activity (thread_id, updated_at) "
+                "SELECT DISTINCT thread_id, ? FROM checkpoints", (now,))
+
+            expired = await self.conn.execute_fetchall(
+                "SELECT thread_id FROM thread_activity WHERE updated_at < ?", (now - self.ttl_seconds,))
+            expired = [(row[0],) for row in expired]
+            for table in ("writes", "checkpoints", "thread_activity"):
+                await self.conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", expired)
+
+            # Subgraph checkpoints older than their thread's newest top-level checkpoint belong to finished runs
+            cursor = await self.conn.execute("""
+                DELETE FROM checkpoints WHERE checkpoint_ns != '' AND checkpoint_id < (
+                    SELECT MAX(root.checkpoint_id) FROM checkpoints AS root
+                    WHERE root.thread_id = checkpoints.thread_id AND root.checkpoint_ns = '')""")
+            subgraphs = cursor.rowcount
+
+            # Keep the newest checkpoints of each thread; checkpoint ids sort by creation time
+            cursor = await self.conn.execute("""
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS newest
+                        FROM checkpoints)
+                    WHERE newest > ?)""", (self.max_per_thread,))
+            versions = cursor.rowcount
+
+            cursor = await self.conn.execute("""
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints AS c WHERE c.thread_id = writes.thread_id
+                    AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id)""")
+            writes = cursor.rowcount
+            await self.conn.commit()
+            await self.conn.execute("PRAGMA incremental_vacuum")
+
+        self.compactions += 1
+        self.last_compaction = {"expired_threads": len(expired), "subgraph_checkpoints": subgraphs,
+                                "old_checkpoints": versions, "writes": writes,
+                                "seconds": round(time.time() - now, 3)}
+        return self.last_compaction
+
+    async def run_compactor(self, interval: float = CHECKPOINT_COMPACT_INTERVAL_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                result = await self.compact()
+                if any(result[key] for key in ("expired_threads", "subgraph_checkpoints", "old_checkpoints")):
+                    print(f"Compacted checkpoints: {result}")
+            except Exception as e:
+                logging.error(f"Checkpoint compaction failed: {e}", exc_info=True)
+
+    async def stats(self) -> dict:
+        await self.setup()
+        async with self.lock:
+            ((threads,),) = await self.conn.execute_fetchall("SELECT COUNT(*) FROM thread_activity")
+            ((checkpoints,),) = await self.conn.execute_fetchall("SELECT COUNT(*) FROM checkpoints")
+            ((writes,),) = await self.conn.execute_fetchall("SELECT COUNT(*) FROM writes")
+            ((pages,),) = await self.conn.execute_fetchall("PRAGMA page_count")
+            ((page_size,),) = await self.conn.execute_fetchall("PRAGMA page_size")
+        return {
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "writes": writes,
+            "size_bytes": pages * page_size,
+            "compactions": self.compactions,
+            "last_compaction": self.last_compaction,
+        }
+
+
+async def open_checkpointer(path: str = CHECKPOINT_DB_PATH) -> CompactingSqliteSaver:
+    '''Opens the checkpoint database; must be called from the event loop the app runs on'''
+    if path != ":memory:":
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = await aiosqlite.connect(path)
+    # Must precede table creation to take effect on a new file; lets compaction return freed pages
+    await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    await conn.execute("PRAGMA journal_mode=WAL")
+    checkpointer = CompactingSqliteSaver(conn)
+    await checkpointer.setup()
+    return checkpointer
@@ -0,0 +1,77 @@
+import os
+import logging
+from dotenv import load_dotenv
+from beanie import init_beanie
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+from app.backend.storage.models import UserMetadata
+
+# Load environment variables
+load_dotenv()
+MONGO_URL = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "lulullm")
+MONGO_TLS = os.getenv("MONGO_TLS", "true").lower() == "true"
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", 5000))
+
+# One client (and so one connection pool) shared by the raw collections and Beanie
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        if MONGO_URL and MONGO_URL.startswith("mongomock://"):
+            # In-memory stand-in for tests; needs the optional mongomock-motor package
+            try:
+                from mongomock_motor import AsyncMongoMockClient
+            except ImportError as e:
+                raise ImportError("MONGO_URI=mongomock:// requires `pip install mongomock-motor`") from e
+            _client = AsyncMongoMockClient()
+        else:
+            tls_options = dict(tls=True,
+                               tlsAllowInvalidCertificates=True,
+                               tlsAllowInvalidHostnames=True) if MONGO_TLS else {}
+            _client = AsyncIOMotorClient(
+                MONGO_URL,
+                serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+                connectTimeoutMS=MONGO_TIMEOUT_MS,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                retryWrites=False,
+                **tls_options,
+            )
+    return _client
+
+
+def get_database():
+    return get_client()[MONGO_DB_NAME]
+
+
+async def ensure_indexes(db):
+    '''Creates the unique indexes behind the username and user_id lookups'''
+    # Beanie picks the metadata collection name, so ask it rather than hard-coding one
+    for collection, field in ((db["users"], "username"), (UserMetadata.get_motor_collection(), "user_id")):
+        try:
+            await collection.create_index(field, unique=True, name=f"{field}_unique")
+        except PyMongoError as e:
+            logging.error(f"Could not create unique index on {collection.name}.{field}: {e}")
+
+
+# Initialize MongoDB connection
+async def init_database():
+    db = get_database()
+    await init_beanie(
+        database=db,
+        document_models=[UserMetadata],
+    )
+    await ensure_indexes(db)
+    return db  # Return the database instance
+
+
+def close_database():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+ROOT_DIR = Path(__file__).resolve().parents[3]
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", str(ROOT_DIR / "data" / "jobs.sqlite"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", 5))
+
+QUEUED, RUNNING, DONE, DEAD = "queued", "running", "done", "dead"
+
+
+class JobQueue:
+    '''Durable background jobs in a local SQLite file.
+
+    Jobs survive restarts, run on a fixed number of workers, are retried with exponential
+    backoff and are dead-lettered after max_attempts failures.
+    '''
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, workers: int = JOB_WORKERS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, retry_base: float = JOB_RETRY_BASE_SECONDS):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.handlers = {}
+        self.tasks = []
+        self.running = 0
+        self.job_added = asyncio.Event()
+        self.lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                dedupe_key TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                run_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                last_error TEXT
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(status, run_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs(dedupe_key, status)")
+
+    def register(self, kind: str, handler, batch_size: int = 1):
+        '''handler is an async function taking the job's payload dict, or a list of up to
+        batch_size payloads when batch_size > 1'''
+        self.handlers[kind] = (handler, batch_size)
+
+    def enqueue(self, kind: str, payload: dict, dedupe_key: str = None) -> int:
+        '''Adds a job; a still-queued job with the same dedupe_key gets the newer payload instead'''
+        now = time.time()
+        with self.lock:
+            if dedupe_key is not None:
+                row = self.conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status = ? ORDER BY id LIMIT 1",
+                    (dedupe_key, QUEUED),
+                ).fetchone()
+                if row:
+                    self.conn.execute("UPDATE jobs SET payload = ? WHERE id = ?", (json.dumps(payload), row["id"]))
+                    return row["id"]
+            job_id = self.conn.execute(
+                "INSERT INTO jobs (kind, dedupe_key, payload, status, run_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, dedupe_key, json.dumps(payload), QUEUED, now, now),
+            ).lastrowid
+        self.job_added.set()
+        return job_id
+
+    def _claim(self) -> list:
+        '''Claims the next ready job, plus more ready jobs of the same kind if it runs in batches'''
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND run_at <= ? ORDER BY run_at LIMIT 1",
+                    (QUEUED, now),
+                ).fetchall()
+                if rows:
+                    batch_size = self.handlers.get(rows[0]["kind"], (None, 1))[1]
+                    if batch_size > 1:
+                        rows += self.conn.execute(
+                            "SELECT * FROM jobs WHERE status = ? AND run_at <= ? AND kind = ? AND id != ? "
+                            "ORDER BY run_at LIMIT ?",
+                            (QUEUED, now, rows[0]["kind"], rows[0]["id"], batch_size - 1),
+                        ).fetchall()
+                    self.conn.executemany("UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                                          [(RUNNING, now, row["id"]) for row in rows])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _complete(self, job_id: int):
+        with self.lock:
+            self.conn.execute("UPDATE jobs SET status = ?, finished_at = ?, last_error = NULL WHERE id = ?",
+                              (DONE, time.time(), job_id))
+
+    def _fail(self, job, error: str):
+        attempts = job["attempts"] + 1
+        now = time.time()
+        with self.lock:
+            if attempts >= self.max_attempts:
+                self.conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = ?, finished_at = ?, last_error = ? WHERE id = ?",
+                    (DEAD, attempts, now, error, job["id"]))
+                logging.error(f"Job {job['id']} ({job['kind']}) dead-lettered after {attempts} attempts: {error}")
+                return
+            delay = self.retry_base * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, run_at = ?, last_error = ? WHERE id = ?",
+                (QUEUED, attempts, now + delay, error, job["id"]))
+        logging.warning(f"Job {job['id']} ({job['kind']}) failed, retrying in {delay:.1f}s: {error}")
+
+    def recover_stalled(self) -> int:
+        '''Re-queues jobs left running by a process that died mid-job'''
+        with self.lock:
+            return self.conn.execute("UPDATE jobs SET status = ?, run_at = ? WHERE status = ?",
+                                     (QUEUED, time.time(), RUNNING)).rowcount
+
+    def start(self):
+        recovered = self.recover_stalled()
+        if recovered:
+            print(f"Re-queued {recovered} interrupted jobs")
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def _worker(self):
+        while True:
+            jobs = self._claim()
+            if not jobs:
+                self.job_added.clear()
+                try:
+                    # Wake up for new jobs, or poll for retries whose backoff has elapsed
+                    await asyncio.wait_for(self.job_added.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.running += 1
+            try:
+                handler, batch_size = self.handlers[jobs[0]["kind"]]
+                payloads = [json.loads(job["payload"]) for job in jobs]
+                await handler(payloads if batch_size > 1 else payloads[0])
+                for job in jobs:
+                    self._complete(job["id"])
+            except asyncio.CancelledError:
+                raise  # left as running and re-queued on next start
+            except Exception as e:
+                for job in jobs:
+                    self._fail(job, repr(e))
+            finally:
+                self.running -= 1
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self.lock:
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            (oldest,) = self.conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()
+            latency = self.conn.execute(
+                "SELECT AVG(finished_at - created_at), AVG(finished_at - started_at), MAX(finished_at - created_at) "
+                "FROM (SELECT * FROM jobs WHERE status = ? ORDER BY finished_at DESC LIMIT 100)",
+                (DONE,),
+            ).fetchone()
+        return {
+            "queued": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "done": counts.get(DONE, 0),
+            "dead": counts.get(DEAD, 0),
+            "workers": self.workers,
+            "busy_workers": self.running,
+            "oldest_queued_age_seconds": now - oldest if oldest else 0.0,
+            "avg_latency_seconds": latency[0],
+            "avg_run_seconds": latency[1],
+            "max_latency_seconds": latency[2],
+        }
+
+    def dead_letters(self, limit: int = 20) -> list:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, kind, dedupe_key, attempts, created_at, finished_at, last_error FROM jobs "
+                "WHERE status = ? ORDER BY finished_at DESC LIMIT ?",
+                (DEAD, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def purge_done(self, older_than_seconds: float = 24 * 60 * 60) -> int:
+        with self.lock:
+            return self.conn.execute("DELETE FROM jobs WHERE status = ? AND finished_at < ?",
+                                     (DONE, time.time() - older_than_seconds)).rowcount
@@ -14,6 +14,9 @@ class UserMetadata(Document):  # Inherit from Beanie's Document
     class Settings:
         collection = "user_metadata"  # Specify the MongoDB collection name
 
+# Fields the metadata extractor distills from chat; ids and timestamps are bookkeeping only
+EXTRACTED_FIELDS = ["stress_triggers", "indecisiveness_triggers", "preferred_tools", "decision_patterns"]
+
 
 
 
@@ -1,10 +1,15 @@
 from langchain_openai import ChatOpenAI
 from langgraph.checkpoint.base import Checkpoint
-from pymongo import MongoClient
+from pymongo import MongoClient, ReplaceOne
 from beanie import init_beanie, PydanticObjectId
 from app.backend.storage.models import UserMetadata
+from app.backend.tracing import tracer
 import asyncio
+import contextlib
 import os
+import time
+import weakref
+from collections import OrderedDict
 from datetime import datetime
 from dotenv import load_dotenv
 import uuid
@@ -12,50 +17,181 @@ import logging
 
 # Load environment variables
 load_dotenv()
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", 10_000))
+METADATA_CACHE_TTL_SECONDS = int(os.getenv("METADATA_CACHE_TTL_SECONDS", 30 * 60))
+METADATA_FLUSH_INTERVAL_SECONDS = float(os.getenv("METADATA_FLUSH_INTERVAL_SECONDS", 5))
+METADATA_FLUSH_BATCH_SIZE = int(os.getenv("METADATA_FLUSH_BATCH_SIZE", 100))
 
 class MetadataManager:
-    def __init__(self):
-        self.active_sessions = {}
-        self.lock = asyncio.Lock()
+    def __init__(self, max_entries: int = METADATA_CACHE_MAX_ENTRIES, ttl_seconds: int = METADATA_CACHE_TTL_SECONDS,
+                 flush_interval: float = METADATA_FLUSH_INTERVAL_SECONDS, flush_batch_size: int = METADATA_FLUSH_BATCH_SIZE):
+        # user_id -> (metadata, cached_at), oldest first
+        self.active_sessions = OrderedDict()
+        # user_id -> in-flight load shared by every concurrent caller for that user
+        self.inflight = {}
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # user_id -> metadata updated in memory but not yet written to MongoDB
+        self.dirty = {}
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self.flush_requested = asyncio.Event()
+        self.closed = False
+        self.flushes = 0
+        self.flushed = 0
+        self.flush_failures = 0
+        self.last_flush_seconds = None
+        # session_id -> number of the last chat turn already distilled into metadata
+        self.extracted_through = {}
+        # user_id -> lock held while that user's metadata is extracted and merged
+        self.extraction_locks = weakref.WeakValueDictionary()
     
     async def get_metadata(self, user_id) -> UserMetadata:
-        async with self.lock:
-            if user_id not in self.active_sessions:
-                # Try to load existing metadata
-                metadata = await UserMetadata.find_one(UserMetadata.user_id == user_id)
-                if metadata:
-                    self.active_sessions[user_id] = metadata
-                else:
-                    self.active_sessions[user_id] = UserMetadata(
-                        user_id=user_id,
-                        session_id=str(uuid.uuid4()),
-                    )
-            return self.active_sessions[user_id]
+        entry = self.active_sessions.get(user_id)
+        if entry and time.monotonic() - entry[1] < self.ttl_seconds:
+            self.active_sessions.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        load = self.inflight.get(user_id)
+        if load is None:
+            load = asyncio.ensure_future(self._load(user_id))
+            self.inflight[user_id] = load
+            load.add_done_callback(lambda _: self.inflight.pop(user_id, None))
+        # Shield so one cancelled request doesn't cancel the load for everyone waiting on it
+        return await asyncio.shield(load)
+
+    async def _load(self, user_id) -> UserMetadata:
+        if user_id in self.dirty:
+            return self.dirty[user_id]
+        # Try to load existing metadata
+        with tracer.span("db", "metadata.find_one"):
+            metadata = await UserMetadata.find_one(UserMetadata.user_id == user_id)
+        # add_metadata may have cached a newer instance while we were waiting on the database
+        entry = self.active_sessions.get(user_id)
+        if entry and time.monotonic() - entry[1] < self.ttl_seconds:
+            return entry[0]
+        if user_id in self.dirty:
+            return self.dirty[user_id]
+        if not metadata:
+            metadata = UserMetadata(
+                user_id=user_id,
+                session_id=str(uuid.uuid4()),
+            )
+        self._cache(user_id, metadata)
+        return metadata
+
+    def _cache(self, user_id, metadata: UserMetadata):
+        self.active_sessions[user_id] = (metadata, time.monotonic())
+        self.active_sessions.move_to_end(user_id)
+        while len(self.active_sessions) > self.max_entries:
+            self.active_sessions.popitem(last=False)
+            self.evictions += 1
+
+    def evict_expired(self) -> int:
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [user_id for user_id, (_, cached_at) in self.active_sessions.items() if cached_at < cutoff]
+        for user_id in expired:
+            del self.active_sessions[user_id]
+        self.evictions += len(expired)
+        return len(expired)
+
+    def pending_turns(self, session) -> list:
+        '''Turns of a session that haven't been folded into the user's metadata yet'''
+        return session.turns_since(self.extracted_through.get(session.session_id, 0))
+
+    def mark_extracted(self, session_id: str, turn: int):
+        self.extracted_through[session_id] = max(turn, self.extracted_through.get(session_id, 0))
+
+    @contextlib.asynccontextmanager
+    async def extracting(self, user_ids):
+        '''Serializes extraction per user, so concurrent jobs don't each merge into the same base metadata'''
+        locks = []
+        for user_id in sorted(set(user_ids)):  # Fixed order, so overlapping batches can't deadlock
+            lock = self.extraction_locks.get(user_id)
+            if lock is None:
+                lock = self.extraction_locks[user_id] = asyncio.Lock()
+            locks.append(lock)
+        async with contextlib.AsyncExitStack() as stack:
+            for lock in locks:
+                await stack.enter_async_context(lock)
+            yield
+
+    def forget_session(self, session_id: str):
+        self.extracted_through.pop(session_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.active_sessions),
+            "max_entries": self.max_entries,
+            "inflight": len(self.inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "flush_queue_depth": len(self.dirty),
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "flush_failures": self.flush_failures,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
         
     async def add_metadata(self, user_id: str, metadata_instance: UserMetadata):
-        print("Adding metadata")
+        # Write-behind: serve the new metadata from memory right away and persist it with the next batch
+        self._cache(user_id, metadata_instance)
+        self.dirty[user_id] = metadata_instance
+        logging.info(f"Metadata for user {user_id} queued for flush: {metadata_instance}")
+        if len(self.dirty) >= self.flush_batch_size:
+            self.flush_requested.set()
+
+    async def flush(self) -> int:
+        '''Persists every dirty entry with one bulk upsert keyed on user_id'''
+        if not self.dirty:
+            return 0
+        batch, self.dirty = self.dirty, {}
+        operations = [
+            ReplaceOne({"user_id": user_id},
+                       metadata.model_dump(exclude={"id", "revision_id"}),
+                       upsert=True)
+            for user_id, metadata in batch.items()
+        ]
+        start = time.perf_counter()
         try:
-    
-            existing_metadata = await UserMetadata.find_one(UserMetadata.user_id == user_id)
-
-            if existing_metadata:
-                # Replace the existing document
-                metadata_instance.id = existing_metadata.id  # Ensure the ID is preserved
-                await metadata_instance.replace()
-            else:
-                # Insert a new document if no match is found
-                await metadata_instance.insert()
-            print("Metadata updated")
-                
-            # Update the active sessions
-            self.active_sessions[user_id] = metadata_instance
-
-            logging.info(f"Metadata for user {user_id} updated: {metadata_instance}")
-            print(f"Metadata for user {user_id} updated: {metadata_instance}")
+            with tracer.span("db", "metadata.bulk_write", documents=len(operations)):
+                await UserMetadata.get_motor_collection().bulk_write(operations, ordered=False)
         except Exception as e:
-            logging.error(f"Error adding metadata for user {user_id}: {e}", exc_info=True)
-            print(f"Error adding metadata for user {user_id}: {e}")
-         
+            # Re-queue anything that wasn't superseded while we were flushing
+            for user_id, metadata in batch.items():
+                self.dirty.setdefault(user_id, metadata)
+            self.flush_failures += 1
+            logging.error(f"Error flushing metadata for {len(batch)} users: {e}", exc_info=True)
+            print(f"Error flushing metadata for {len(batch)} users: {e}")
+            return 0
+        self.last_flush_seconds = time.perf_counter() - start
+        self.flushes += 1
+        self.flushed += len(batch)
+        print(f"Flushed metadata for {len(batch)} users in {self.last_flush_seconds:.3f}s")
+        return len(batch)
+
+    async def run_flusher(self):
+        '''Flushes dirty metadata every flush interval, or sooner once a full batch is queued'''
+        while not self.closed:
+            try:
+                await asyncio.wait_for(self.flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_requested.clear()
+            await self.flush()
+
+    async def close(self):
+        self.closed = True
+        self.flush_requested.set()
+        await self.flush()
 
 
 metadata = MetadataManager()
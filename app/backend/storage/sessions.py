@@ -0,0 +1,134 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+import secrets
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", 12 * 60 * 60))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", 50))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", 10_000))
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class Session:
+    def __init__(self, session_id: str, user_id: str, thread_id: str, max_turns: int = SESSION_MAX_TURNS):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.thread_id = thread_id
+        self.transcript = deque(maxlen=max_turns)
+        self.turns = 0  # turns ever added, so numbering survives the deque dropping old ones
+        self.last_seen = time.time()
+
+    @property
+    def config(self) -> dict:
+        return {"configurable": {"thread_id": self.thread_id}}
+
+    def add_turn(self, user_input: str, response: str):
+        self.turns += 1
+        self.transcript.append((self.turns, user_input, response))
+
+    def turns_since(self, turn: int) -> list:
+        '''(turn number, user_input, response) for every kept turn after the given one'''
+        return [entry for entry in self.transcript if entry[0] > turn]
+
+
+class SessionStore:
+    '''Issues signed session tokens and keeps each session's thread and bounded transcript with TTL eviction.
+
+    Tokens carry the user and thread ids, so any worker sharing SESSION_SECRET can resolve them, and the
+    conversation itself lives in the checkpointed thread. Transcripts are kept per worker and only feed
+    metadata extraction. on_evict(session) runs for every session dropped, whether expired or evicted
+    to stay under max_sessions.
+    '''
+
+    def __init__(self, secret: str = SESSION_SECRET, ttl_seconds: int = SESSION_TTL_SECONDS,
+                 max_sessions: int = MAX_SESSIONS, max_turns: int = SESSION_MAX_TURNS, on_evict=None):
+        if not secret:
+            logging.warning("SESSION_SECRET is not set; session tokens will not survive a restart")
+            secret = secrets.token_hex(32)
+        self.secret = secret.encode("utf-8")
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.on_evict = on_evict
+        self.sessions = OrderedDict()
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self.secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def create(self, user_id: str, thread_id: str = None):
+        '''Starts a session for a signed-in user and returns (token, session)'''
+        claims = {"sid": secrets.token_urlsafe(16),
+                  "uid": user_id,
+                  "tid": thread_id or secrets.token_hex(16),
+                  "iat": int(time.time())}
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        session = self._store(claims)
+        return f"{payload}.{self._sign(payload)}", session
+
+    def get(self, token: str):
+        '''Resolves a token to its live session, or None if it is forged or expired'''
+        # Tokens come straight from the client, so anything malformed (including non-ASCII) is just invalid
+        try:
+            payload, signature = token.split(".", 1)
+            if not hmac.compare_digest(signature.encode("ascii"), self._sign(payload).encode("ascii")):
+                return None
+            claims = json.loads(_b64decode(payload))
+            if time.time() - claims["iat"] > self.ttl_seconds:
+                return None
+        except (AttributeError, ValueError, UnicodeError, TypeError, KeyError):
+            return None
+
+        session = self.sessions.get(claims["sid"])
+        if session is None or time.time() - session.last_seen > self.ttl_seconds:
+            session = self._store(claims)
+        self.sessions.move_to_end(session.session_id)
+        session.last_seen = time.time()
+        return session
+
+    def _store(self, claims: dict) -> Session:
+        session = Session(claims["sid"], claims["uid"], claims["tid"], max_turns=self.max_turns)
+        self.sessions[session.session_id] = session
+        while len(self.sessions) > self.max_sessions:
+            self._evicted(self.sessions.popitem(last=False)[1])
+        return session
+
+    def _evicted(self, session: Session):
+        if self.on_evict is None:
+            return
+        try:
+            self.on_evict(session)
+        except Exception as e:
+            logging.error(f"Error releasing session {session.session_id}: {e}")
+
+    def expired_ids(self) -> list:
+        cutoff = time.time() - self.ttl_seconds
+        return [sid for sid, session in self.sessions.items() if session.last_seen < cutoff]
+
+    def evict_expired(self) -> int:
+        expired = self.expired_ids()
+        for sid in expired:
+            self._evicted(self.sessions.pop(sid))
+        return len(expired)
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
+
+    def __len__(self):
+        return len(self.sessions)
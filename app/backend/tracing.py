@@ -0,0 +1,376 @@
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict
+from pathlib import Path
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.errors import GraphBubbleUp
+
+# Load environment variables
+load_dotenv()
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+# Write each request's trace to <dir>/<request id>.json; unset keeps recent traces in memory only
+TRACE_DUMP_DIR = os.getenv("TRACE_DUMP_DIR")
+# Recent traces served by /admin/traces
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", 200))
+# Paths that still count towards the HTTP metrics but are not kept as traces
+TRACE_SKIP_PATHS = set(os.getenv("TRACE_SKIP_PATHS", "/metrics,/healthz,/readyz").split(","))
+# A client's own X-Request-ID is kept on its trace for correlation when it looks like an id
+CLIENT_REQUEST_ID = re.compile(r"[A-Za-z0-9_.:-]{1,128}")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+STAGE_SECONDS = "lulu_stage_duration_seconds"
+STAGE_ERRORS = "lulu_stage_errors_total"
+LLM_TOKENS = "lulu_llm_tokens_total"
+HTTP_SECONDS = "lulu_http_request_duration_seconds"
+METRIC_HELP = {
+    STAGE_SECONDS: "Time spent in each request stage (routing, agent, llm, tool, retrieval, db, metadata, context)",
+    STAGE_ERRORS: "Stage spans that ended with an exception",
+    LLM_TOKENS: "Prompt and completion tokens reported by the model, per stage",
+    HTTP_SECONDS: "HTTP request latency by route and status",
+}
+
+# The trace of the request being handled and the innermost open span in it
+_trace = contextvars.ContextVar("trace", default=None)
+_span = contextvars.ContextVar("span", default=None)
+
+
+def format_labels(labels: tuple) -> str:
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped))
+
+
+class Metrics:
+    '''Latency histograms and counters keyed by label set, rendered in the Prometheus text format'''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}  # metric -> {labels: {"buckets": cumulative counts, "sum", "count"}}
+        self.counters = {}  # metric -> {labels: value}
+        self.lock = threading.Lock()
+
+    def observe(self, metric: str, labels: dict, seconds: float):
+        key = tuple(labels.items())
+        with self.lock:
+            series = self.histograms.setdefault(metric, {}).get(key)
+            if series is None:
+                series = self.histograms[metric][key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["buckets"][index] += 1
+            series["sum"] += seconds
+            series["count"] += 1
+
+    def inc(self, metric: str, labels: dict, amount: float = 1):
+        key = tuple(labels.items())
+        with self.lock:
+            series = self.counters.setdefault(metric, {})
+            series[key] = series.get(key, 0) + amount
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            for metric, series in self.histograms.items():
+                lines += [f"# HELP {metric} {METRIC_HELP.get(metric, metric)}", f"# TYPE {metric} histogram"]
+                for key, values in series.items():
+                    labels = format_labels(key)
+                    for bound, count in zip(self.buckets, values["buckets"]):
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound:g}"}} {count}')
+                    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {values["count"]}')
+                    lines.append(f"{metric}_sum{{{labels}}} {values['sum']:.6f}")
+                    lines.append(f"{metric}_count{{{labels}}} {values['count']}")
+            for metric, series in self.counters.items():
+                lines += [f"# HELP {metric} {METRIC_HELP.get(metric, metric)}", f"# TYPE {metric} counter"]
+                lines += [f"{metric}{{{format_labels(key)}}} {value:g}" for key, value in series.items()]
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    '''Spans recorded while handling one request'''
+
+    def __init__(self, request_id: str, name: str):
+        self.request_id = request_id
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self.attributes = {}
+        self.ids = itertools.count(1)
+
+    def to_dict(self) -> dict:
+        stage_ms = {}
+        tokens = {"prompt_tokens": 0, "completion_tokens": 0}
+        for span in self.spans:
+            stage_ms[span["stage"]] = stage_ms.get(span["stage"], 0.0) + span["duration_ms"]
+            for kind in tokens:
+                tokens[kind] += span.get(kind, 0)
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            **self.attributes,
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            # Nested spans overlap, so stage totals can add up to more than the request took
+            "stage_ms": {stage: round(ms, 2) for stage, ms in stage_ms.items()},
+            "tokens": tokens,
+            "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+        }
+
+
+def message_usage(message) -> dict:
+    '''Token counts from an AIMessage's usage metadata (empty when the model reported none)'''
+    usage = getattr(message, "usage_metadata", None) or {}
+    if not usage:
+        return {}
+    return {"prompt_tokens": usage.get("input_tokens", 0), "completion_tokens": usage.get("output_tokens", 0)}
+
+
+def error_name(error: BaseException):
+    # Handoffs between the supervisor and its workers travel as GraphBubbleUp exceptions
+    return None if isinstance(error, GraphBubbleUp) else type(error).__name__
+
+
+class Tracer:
+    '''Per-stage spans for every request, aggregated into Prometheus metrics.
+
+    Code on the hot path wraps each stage in `with tracer.span(stage, name)`. Spans always feed the
+    /metrics histograms; inside an HTTP request (see TracingMiddleware) they are also collected into
+    that request's trace, kept for /admin/traces and optionally dumped as JSON.
+    '''
+
+    def __init__(self, enabled: bool = TRACING_ENABLED, dump_dir: str = TRACE_DUMP_DIR, keep: int = TRACE_KEEP):
+        self.enabled = enabled
+        self.dump_dir = Path(dump_dir) if dump_dir else None
+        self.keep = keep
+        self.metrics = Metrics()
+        self.recent = OrderedDict()  # request_id -> finished trace dict, oldest first
+        self.lock = threading.Lock()
+        self.dumped = 0
+        self.dump_failures = 0
+
+    def record(self, stage: str, name: str, start: float, seconds: float, attributes: dict = None, error: str = None,
+               trace: Trace = None, span_id: int = None, parent: int = None):
+        '''Adds a finished span to the metrics and, when given a trace, to that trace'''
+        labels = {"stage": stage, "name": name}
+        attributes = attributes or {}
+        self.metrics.observe(STAGE_SECONDS, labels, seconds)
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if attributes.get(kind):
+                self.metrics.inc(LLM_TOKENS, {**labels, "kind": kind.removesuffix("_tokens")}, attributes[kind])
+        if error:
+            self.metrics.inc(STAGE_ERRORS, labels)
+        if trace is not None:
+            trace.spans.append({"id": span_id, "parent": parent, "stage": stage, "name": name,
+                                "start_ms": round((start - trace.start) * 1000, 2),
+                                "duration_ms": round(seconds * 1000, 2),
+                                **({"error": error} if error else {}), **attributes})
+
+    @contextmanager
+    def span(self, stage: str, name: str, **attributes):
+        '''Times the enclosed block; yields a dict for attributes such as token counts or cache hits'''
+        if not self.enabled:
+            yield attributes
+            return
+        trace = _trace.get()
+        parent = _span.get()
+        span_id = next(trace.ids) if trace is not None else None
+        token = _span.set(span_id) if trace is not None else None
+        start = time.perf_counter()
+        error = None
+        try:
+            yield attributes
+        except BaseException as e:
+            error = error_name(e)
+            raise
+        finally:
+            if token is not None:
+                _span.reset(token)
+            self.record(stage, name, start, time.perf_counter() - start, attributes, error, trace, span_id, parent)
+
+    @contextmanager
+    def trace(self, request_id: str, name: str, keep: bool = True):
+        '''Collects the spans of the enclosed block (one request) into a trace'''
+        trace = Trace(request_id, name)
+        trace_token = _trace.set(trace)
+        span_token = _span.set(None)
+        try:
+            yield trace
+        finally:
+            _span.reset(span_token)
+            _trace.reset(trace_token)
+            trace.duration = time.perf_counter() - trace.start
+            if keep:
+                self.finish(trace)
+
+    def finish(self, trace: Trace):
+        data = trace.to_dict()
+        with self.lock:
+            self.recent[trace.request_id] = data
+            self.recent.move_to_end(trace.request_id)
+            while len(self.recent) > self.keep:
+                self.recent.popitem(last=False)
+        if self.dump_dir is not None:
+            path = self.dump_dir / f"{trace.request_id}.json"
+            try:
+                self.dump_dir.mkdir(parents=True, exist_ok=True)
+                path.write_text(json.dumps(data, default=str))
+                self.dumped += 1
+            except OSError as e:
+                self.dump_failures += 1
+                logging.error(f"Could not write trace {trace.request_id} to {path}: {e}")
+
+    def get(self, request_id: str):
+        with self.lock:
+            return self.recent.get(request_id)
+
+    def summaries(self) -> list:
+        '''Newest first, without the spans'''
+        with self.lock:
+            traces = list(self.recent.values())
+        return [{key: value for key, value in trace.items() if key != "spans"} for trace in reversed(traces)]
+
+    def callbacks(self, agents) -> "TraceCallbackHandler":
+        return TraceCallbackHandler(self, agents)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "traces": len(self.recent), "keep": self.keep,
+                "dump_dir": str(self.dump_dir) if self.dump_dir else None,
+                "dumped": self.dumped, "dump_failures": self.dump_failures}
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    '''Records a LangGraph run's agent hops, LLM calls (with token usage) and tool calls as spans.
+
+    LLM calls made outside any worker agent are the supervisor's routing decisions. Create one
+    handler per run, inside the request, so its spans land in that request's trace.
+    '''
+
+    run_inline = True
+
+    def __init__(self, tracer: Tracer, agents):
+        self.tracer = tracer
+        self.agents = set(agents)
+        self.trace = _trace.get()
+        self.parent = _span.get()
+        self.runs = {}  # run_id -> (worker agent the run is part of, enclosing span id)
+        self.open = {}  # run_id -> (stage, name, start, span id, parent span id, attributes)
+
+    def enclosing(self, parent_run_id):
+        return self.runs.get(parent_run_id, (None, self.parent))
+
+    def start(self, stage: str, name: str, run_id, parent_run_id, agent, **attributes):
+        _, parent = self.enclosing(parent_run_id)
+        span_id = next(self.trace.ids) if self.trace is not None else None
+        self.runs[run_id] = (agent, span_id)
+        self.open[run_id] = (stage, name, time.perf_counter(), span_id, parent, attributes)
+
+    def end(self, run_id, error: BaseException = None, **attributes):
+        self.runs.pop(run_id, None)
+        opened = self.open.pop(run_id, None)
+        if opened is None:
+            return
+        stage, name, start, span_id, parent, started_attributes = opened
+        self.tracer.record(stage, name, start, time.perf_counter() - start, {**started_attributes, **attributes},
+                           error_name(error) if error is not None else None, self.trace, span_id, parent)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        agent, parent = self.enclosing(parent_run_id)
+        name = kwargs.get("name")
+        # A worker shows up as the supervisor's node and again as its own graph; time the outer one
+        if name in self.agents and name != agent:
+            self.start("agent", name, run_id, parent_run_id, name)
+        else:
+            self.runs[run_id] = (agent, parent)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self.end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        agent, _ = self.enclosing(parent_run_id)
+        model = (kwargs.get("metadata") or {}).get("ls_model_name")
+        if agent:
+            self.start("llm", agent, run_id, parent_run_id, agent, model=model)
+        else:
+            self.start("routing", "supervisor", run_id, parent_run_id, agent, model=model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                usage = usage or message_usage(getattr(generation, "message", None))
+        if not usage:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            usage = {kind: token_usage[kind] for kind in ("prompt_tokens", "completion_tokens") if kind in token_usage}
+        self.end(run_id, **usage)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        agent, _ = self.enclosing(parent_run_id)
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        self.start("tool", name, run_id, parent_run_id, agent)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self.end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self.end(run_id, error)
+
+
+class TracingMiddleware:
+    '''ASGI middleware giving every HTTP request a trace and recording its latency by route.
+
+    Trace ids are always generated here and returned in the X-Request-ID response header; a client's
+    own X-Request-ID is only recorded on the trace as client_request_id, so it can't replace or
+    collide with another request's trace.
+    '''
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.tracer.enabled:
+            return await self.app(scope, receive, send)
+        request_id = uuid.uuid4().hex
+        client_request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        keep = scope["path"] not in TRACE_SKIP_PATHS
+        with self.tracer.trace(request_id, f"{scope['method']} {scope['path']}", keep=keep) as trace:
+            if CLIENT_REQUEST_ID.fullmatch(client_request_id):
+                trace.attributes["client_request_id"] = client_request_id
+            try:
+                # Returns once the whole body is sent, so streamed responses are timed to the last event
+                await self.app(scope, receive, send_with_request_id)
+            finally:
+                # Label by route template rather than raw path to keep the series count bounded
+                route = getattr(scope.get("route"), "path", "unmatched")
+                trace.attributes.update(method=scope["method"], route=route, status=status)
+                self.tracer.metrics.observe(HTTP_SECONDS, {"method": scope["method"], "route": route,
+                                                           "status": str(status)},
+                                            time.perf_counter() - trace.start)
+
+
+tracer = Tracer()
@@ -81,6 +81,9 @@ function App() {
       // Send as query parameter
       const response = await fetch(`${API_BASE_URL}/invoke?user_input=${encodeURIComponent(userMessage)}`, {
         method: 'POST',
+        headers: {
+          'Authorization': `Bearer ${user.session_token}`,
+        },
       });
 
       if (!response.ok) {
@@ -10,7 +10,8 @@ from langchain_community.vectorstores import Chroma
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
+from app.backend.rag.embedding_cache import get_embeddings
 
 # Load environment variables
 load_dotenv()
@@ -35,7 +36,7 @@ splits = text_splitter.split_documents(docs)
 
 # Embed
 vectorstore = Chroma.from_documents(documents=splits, 
-                                    embedding=OpenAIEmbeddings())
+                                    embedding=get_embeddings())
 
 retriever = vectorstore.as_retriever()
 
@@ -87,7 +88,8 @@ from langchain_community.vectorstores import Chroma
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
+from app.backend.rag.embedding_cache import get_embeddings
 from langchain.retrievers.multi_query import MultiQueryRetriever
 
 # Load environment variables
@@ -113,7 +115,7 @@ splits = text_splitter.split_documents(docs)
 
 # Embed
 vectorstore = Chroma.from_documents(documents=splits, 
-                                    embedding=OpenAIEmbeddings())
+                                    embedding=get_embeddings())
 
 query = "What is the 4-7-8 breathing technique?"
 retriever = vectorstore.as_retriever()